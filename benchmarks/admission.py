@@ -0,0 +1,115 @@
+"""Behaviour of the miner's adaptive upstream concurrency limit.
+
+Callers go through an `AdaptiveLimit` in front of two simulated upstreams: one
+whose latency does not depend on load, which must leave the limit alone, and one
+that starts queueing calls beyond a small capacity halfway through, which must
+shrink it. Exits non-zero when either expectation fails, for CI.
+
+Usage, from the repository root:
+
+    python -m benchmarks.admission
+    python -m benchmarks.admission --calls 8000 --sigma 1
+"""
+import sys
+import json
+import random
+import asyncio
+import argparse
+from utils.admission import AdaptiveLimit, Overloaded
+from benchmarks.standins import percentiles
+
+
+async def simulate(config, latency_of) -> dict:
+    # latency_of(in_flight, done) gives the latency of the next call.
+    limit = AdaptiveLimit(initial=config.initial, max_queue=config.queue_size)
+    latencies = []
+    lowest = limit.limit
+    rejected = 0
+    remaining = config.calls
+
+    async def caller():
+        nonlocal lowest, rejected, remaining
+        while remaining > 0:
+            remaining -= 1
+            try:
+                await limit.acquire()
+            except Overloaded:
+                rejected += 1
+                await asyncio.sleep(0.001)
+                continue
+            latency = latency_of(limit.in_flight, len(latencies))
+            await asyncio.sleep(latency)
+            latencies.append(latency)
+            limit.record(latency)
+            limit.release()
+            lowest = min(lowest, limit.limit)
+
+    await asyncio.gather(*(caller() for _ in range(config.callers)))
+    stats = percentiles(latencies)
+    return {
+        "final_limit": round(limit.limit, 1),
+        "lowest_limit": round(lowest, 1),
+        "rejected": rejected,
+        "p50_ms": round(stats["p50"] * 1000, 2),
+        "p99_ms": round(stats["p99"] * 1000, 2),
+    }
+
+
+async def main(config) -> int:
+    def independent(in_flight, done):
+        # Log-normal spread around the median, whatever the load.
+        return config.latency * random.lognormvariate(0, config.sigma)
+
+    def degrading(in_flight, done):
+        # From halfway, calls beyond the capacity wait for the ones ahead of them.
+        latency = independent(in_flight, done)
+        if done >= config.calls // 2:
+            latency *= max(1.0, in_flight / config.capacity)
+        return latency
+
+    report = {
+        "load_independent": await simulate(config, independent),
+        "degrading": await simulate(config, degrading),
+    }
+    print(json.dumps({"benchmark": "admission", **report}, indent=2))
+
+    failures = []
+    if report["load_independent"]["lowest_limit"] < config.initial:
+        failures.append("the limit shrank on a load-independent upstream")
+    if report["load_independent"]["rejected"]:
+        failures.append("calls were rejected on a load-independent upstream")
+    if report["degrading"]["final_limit"] >= config.initial:
+        failures.append("the limit did not shrink on a degrading upstream")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def get_config():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=4000)
+    parser.add_argument(
+        "--callers",
+        type=int,
+        default=90,
+        help="Concurrent callers, at most the initial limit plus the queue size.",
+    )
+    parser.add_argument("--initial", type=int, default=32)
+    parser.add_argument("--queue_size", type=int, default=64)
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Median upstream latency in seconds."
+    )
+    parser.add_argument(
+        "--sigma", type=float, default=0.5, help="Log-normal spread of the latency."
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=8,
+        help="Concurrent calls the degrading upstream serves without slowing down.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(get_config())))
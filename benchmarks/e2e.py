@@ -0,0 +1,269 @@
+"""Offline end-to-end benchmark of the validator and miner.
+
+Runs the real `Validator.run` and `Miner.handle_blockchain_request` against local
+stand-ins for the entrypoint, the metagraph, the subtensor and the upstream nodes.
+
+Usage, from the repository root:
+
+    python -m benchmarks.e2e --requests 5000 --concurrency 200 --miners 16
+    python -m benchmarks.e2e --mode miner --requests 20000 --concurrency 500
+"""
+import sys
+import time
+import json
+import shlex
+import asyncio
+import argparse
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+from protocol import BlockchainRequest, Chains
+from validator import Validator
+from miner import Miner
+from benchmarks.standins import (
+    EntrypointServer,
+    FakeBlockTracker,
+    FakeMetagraph,
+    FakeSubtensor,
+    InProcessDendrite,
+    MockUpstream,
+    RequestMix,
+    percentiles,
+)
+
+
+@contextmanager
+def argv(args):
+    # The neurons parse their configuration from the command line.
+    saved = sys.argv
+    sys.argv = [saved[0]] + args
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+class BenchMiner(Miner):
+    def __init__(self, uid, metagraph, upstream, args):
+        self.uid = uid
+        self.bench_metagraph = metagraph
+        self.bench_upstream = upstream
+        self.bench_args = args
+        super().__init__()
+
+    def get_config(self):
+        # Without a mock upstream, the upstreams come from the extra arguments.
+        upstreams = [
+            f"{chain.value}={self.bench_upstream.url(chain)}"
+            for chain in Chains
+            if self.bench_upstream is not None
+        ]
+        with argv(
+            ["--logging.logging_dir", tempfile.gettempdir(), "--upstreams", *upstreams]
+            + self.bench_args
+        ):
+            return super().get_config()
+
+    def setup_logging(self):
+        pass
+
+    def setup_bittensor_objects(self):
+        self.metagraph = self.bench_metagraph
+        self.subtensor = FakeSubtensor(self.metagraph)
+        self.wallet = SimpleNamespace(
+            hotkey=SimpleNamespace(ss58_address=self.metagraph.hotkeys[self.uid])
+        )
+        self.my_subnet_uid = self.uid
+
+
+class BenchValidator(Validator):
+    def __init__(self, metagraph, miners, entrypoint, network_latency, args):
+        self.bench_metagraph = metagraph
+        self.bench_miners = miners
+        self.bench_entrypoint = entrypoint
+        self.bench_network_latency = network_latency
+        self.bench_args = args
+        super().__init__()
+
+    def get_config(self):
+        with argv(
+            [
+                "--logging.logging_dir",
+                tempfile.mkdtemp(),
+                "--entrypoint",
+                self.bench_entrypoint,
+            ]
+            + self.bench_args
+        ):
+            return super().get_config()
+
+    def setup_logging(self):
+        pass
+
+    def setup_bittensor_objects(self):
+        self.metagraph = self.bench_metagraph
+        self.subtensor = FakeSubtensor(self.metagraph)
+        self.wallet = SimpleNamespace(
+            hotkey=SimpleNamespace(ss58_address=self.metagraph.hotkeys[0])
+        )
+        self.dendrite = InProcessDendrite(
+            self.bench_miners, self.bench_network_latency
+        )
+        self.my_subnet_uid = 0
+
+    def setup_block_tracker(self):
+        self.block_tracker = FakeBlockTracker()
+
+
+def report(name, total, elapsed, latencies, errors, upstream, cpu):
+    stats = percentiles(latencies)
+    upstream_calls = sum(upstream.calls.values())
+    print(
+        json.dumps(
+            {
+                "benchmark": name,
+                "requests": total,
+                "errors": errors,
+                "requests_per_second": round(total / elapsed, 1),
+                "p50_ms": round(stats["p50"] * 1000, 2),
+                "p95_ms": round(stats["p95"] * 1000, 2),
+                "p99_ms": round(stats["p99"] * 1000, 2),
+                "upstream_calls": upstream_calls,
+                "upstream_calls_per_request": round(upstream_calls / total, 3),
+                "cpu_ms_per_request": round(cpu / total * 1000, 3),
+            },
+            indent=2,
+        )
+    )
+
+
+async def bench_e2e(config, upstream, mix):
+    metagraph = FakeMetagraph(config.miners + 1)
+    miner_args = shlex.split(config.miner_args)
+    miners = {
+        uid: BenchMiner(uid, metagraph, upstream, miner_args)
+        for uid in range(1, config.miners + 1)
+    }
+    entrypoint = EntrypointServer(mix, config.requests, config.concurrency)
+    await entrypoint.start()
+    validator = BenchValidator(
+        metagraph,
+        miners,
+        entrypoint.uri,
+        config.network_latency,
+        shlex.split(config.validator_args),
+    )
+
+    cpu = time.process_time()
+    task = asyncio.create_task(validator.run())
+    await entrypoint.done.wait()
+    cpu = time.process_time() - cpu
+    task.cancel()
+    await entrypoint.stop()
+    report(
+        "e2e",
+        config.requests,
+        entrypoint.finished - entrypoint.started,
+        entrypoint.latencies,
+        entrypoint.errors,
+        upstream,
+        cpu,
+    )
+
+
+async def bench_miner(config, upstream, mix):
+    metagraph = FakeMetagraph(2)
+    miner = BenchMiner(1, metagraph, upstream, shlex.split(config.miner_args))
+    in_flight = asyncio.Semaphore(config.concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(request):
+        nonlocal errors
+        async with in_flight:
+            start = time.monotonic()
+            synapse = BlockchainRequest(**request)
+            synapse = await miner.handle_blockchain_request(synapse)
+            latencies.append(time.monotonic() - start)
+            if synapse.error:
+                errors += 1
+
+    requests = [next(mix) for _ in range(config.requests)]
+    cpu = time.process_time()
+    start = time.monotonic()
+    await asyncio.gather(*(send(request) for request in requests))
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    report("miner", config.requests, elapsed, latencies, errors, upstream, cpu)
+
+
+async def main(config):
+    chains = [Chains(chain) for chain in config.chains] if config.chains else None
+    mix = RequestMix(chains=chains, seed=config.seed)
+    upstream = MockUpstream(
+        latency=config.upstream_latency,
+        sigma=config.upstream_sigma,
+        error_rate=config.upstream_error_rate,
+        rpc_error_rate=config.rpc_error_rate,
+    )
+    await upstream.start()
+    try:
+        if config.mode == "e2e":
+            await bench_e2e(config, upstream, mix)
+        else:
+            await bench_miner(config, upstream, mix)
+    finally:
+        await upstream.stop()
+
+
+def get_config():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["e2e", "miner"], default="e2e")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--miners", type=int, default=16)
+    parser.add_argument(
+        "--chains", nargs="*", default=None, help="Chain ids to request, all by default."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--upstream_latency",
+        type=float,
+        default=0.05,
+        help="Median upstream latency in seconds.",
+    )
+    parser.add_argument(
+        "--upstream_sigma",
+        type=float,
+        default=0.5,
+        help="Log-normal spread of the upstream latency.",
+    )
+    parser.add_argument(
+        "--upstream_error_rate",
+        type=float,
+        default=0.0,
+        help="Share of upstream calls failing with a 503.",
+    )
+    parser.add_argument(
+        "--rpc_error_rate",
+        type=float,
+        default=0.0,
+        help="Share of upstream calls answered with a JSON-RPC error.",
+    )
+    parser.add_argument(
+        "--network_latency",
+        type=float,
+        default=0.005,
+        help="Seconds added to every validator to miner round-trip.",
+    )
+    parser.add_argument(
+        "--validator_args", default="", help="Extra validator command line arguments."
+    )
+    parser.add_argument(
+        "--miner_args", default="", help="Extra miner command line arguments."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(get_config()))
@@ -0,0 +1,193 @@
+"""Replays recorded validator traffic against the miner.
+
+Recordings are written by the validator with `--record_dir`. Requests are sent to
+an in-process miner, backed by the mock upstream or by real upstreams given with
+`--miner_args`, following the recorded arrival times.
+
+Usage, from the repository root:
+
+    python -m benchmarks.replay ~/recordings --speed 1
+    python -m benchmarks.replay ~/recordings --speed 10 --concurrency 500
+    python -m benchmarks.replay ~/recordings --speed 0 --target live \\
+        --miner_args "--upstreams eth-mainnet=http://localhost:8545"
+"""
+import json
+import time
+import shlex
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+from protocol import BlockchainRequest
+from utils.recorder import read_recording
+from benchmarks.e2e import BenchMiner
+from benchmarks.standins import FakeMetagraph, MockUpstream, percentiles
+
+
+def method_of(payload: str) -> str:
+    try:
+        call = json.loads(payload)
+    except (TypeError, ValueError):
+        return "invalid"
+    if isinstance(call, list):
+        return "batch"
+    if isinstance(call, dict):
+        return str(call.get("method"))
+    return "invalid"
+
+
+def summary(latencies):
+    stats = percentiles(latencies)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(stats["p50"] * 1000, 2),
+        "p95_ms": round(stats["p95"] * 1000, 2),
+        "p99_ms": round(stats["p99"] * 1000, 2),
+    }
+
+
+async def replay(config, miner, records):
+    in_flight = asyncio.Semaphore(config.concurrency)
+    latencies = []
+    lags = []
+    recorded = []
+    by_chain = defaultdict(list)
+    by_method = defaultdict(list)
+    errors = Counter()
+    tasks = set()
+
+    async def send(record):
+        try:
+            start = time.monotonic()
+            synapse = BlockchainRequest(
+                chain_id=record["chain_id"], payload=record["payload"]
+            )
+            synapse = await miner.handle_blockchain_request(synapse)
+            latency = time.monotonic() - start
+            latencies.append(latency)
+            recorded.append(record.get("latency", 0))
+            by_chain[record["chain_id"]].append(latency)
+            by_method[method_of(record["payload"])].append(latency)
+            if synapse.error:
+                errors[synapse.error[:80]] += 1
+        finally:
+            in_flight.release()
+
+    first = records[0]["t"]
+    started = time.monotonic()
+    for record in records:
+        if config.speed > 0:
+            due = (record["t"] - first) / config.speed
+            delay = due - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await in_flight.acquire()
+        if config.speed > 0:
+            # Time the request went out after its replayed arrival time.
+            lags.append(max(time.monotonic() - started - due, 0))
+        task = asyncio.create_task(send(record))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    total = len(records)
+    print(
+        json.dumps(
+            {
+                "benchmark": "replay",
+                "speed": config.speed or "max",
+                "requests": total,
+                "recorded_seconds": round(records[-1]["t"] - first, 3),
+                "replay_seconds": round(elapsed, 3),
+                "requests_per_second": round(total / elapsed, 1),
+                **summary(latencies),
+                "recorded_p50_ms": summary(recorded)["p50_ms"],
+                "recorded_p99_ms": summary(recorded)["p99_ms"],
+                "schedule_lag_p99_ms": summary(lags)["p99_ms"],
+                "errors": sum(errors.values()),
+                "error_rate": round(sum(errors.values()) / total, 4),
+                "top_errors": dict(errors.most_common(5)),
+                "chains": {
+                    chain: summary(values) for chain, values in sorted(by_chain.items())
+                },
+                "methods": {
+                    method: summary(values)
+                    for method, values in sorted(by_method.items())
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+async def main(config):
+    records = sorted(read_recording(config.recordings), key=lambda r: r["t"])
+    if config.limit:
+        records = records[: config.limit]
+    if not records:
+        raise SystemExit("No requests found in the recordings.")
+
+    upstream = None
+    if config.target == "mock":
+        upstream = MockUpstream(
+            latency=config.upstream_latency,
+            sigma=config.upstream_sigma,
+            error_rate=config.upstream_error_rate,
+        )
+        await upstream.start()
+    try:
+        miner_args = shlex.split(config.miner_args)
+        miner = BenchMiner(1, FakeMetagraph(2), upstream, miner_args)
+        await replay(config, miner, records)
+    finally:
+        if upstream is not None:
+            await upstream.stop()
+
+
+def get_config():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "recordings", nargs="+", help="Recording files or directories."
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed relative to the recording, 0 sends as fast as possible.",
+    )
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument(
+        "--limit", type=int, default=0, help="Replay only the first requests."
+    )
+    parser.add_argument(
+        "--target",
+        choices=["mock", "live"],
+        default="mock",
+        help="Serve from the mock upstream, or from the upstreams in --miner_args.",
+    )
+    parser.add_argument(
+        "--upstream_latency",
+        type=float,
+        default=0.05,
+        help="Median mock upstream latency in seconds.",
+    )
+    parser.add_argument(
+        "--upstream_sigma",
+        type=float,
+        default=0.5,
+        help="Log-normal spread of the mock upstream latency.",
+    )
+    parser.add_argument(
+        "--upstream_error_rate",
+        type=float,
+        default=0.0,
+        help="Share of mock upstream calls failing with a 503.",
+    )
+    parser.add_argument(
+        "--miner_args", default="", help="Extra miner command line arguments."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(get_config()))
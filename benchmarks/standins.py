@@ -0,0 +1,322 @@
+import json
+import time
+import random
+import asyncio
+import numpy as np
+import websockets
+from aiohttp import web
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from protocol import Chains, BLOCK_TIMES
+
+# Relative frequency of the JSON-RPC methods sent by the entrypoint.
+DEFAULT_METHOD_MIX = {
+    "eth_blockNumber": 20,
+    "eth_chainId": 5,
+    "eth_getBalance": 20,
+    "eth_call": 25,
+    "eth_getBlockByNumber": 10,
+    "eth_getTransactionReceipt": 15,
+    "eth_gasPrice": 5,
+}
+
+ADDRESSES = [f"0x{i:040x}" for i in range(1, 201)]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    values = np.percentile(samples, [50, 95, 99])
+    return {"p50": values[0], "p95": values[1], "p99": values[2]}
+
+
+class RequestMix:
+    """Generates JSON-RPC payloads following a chain and method mix."""
+
+    def __init__(
+        self,
+        chains: Optional[List[Chains]] = None,
+        methods: Optional[Dict[str, int]] = None,
+        seed: int = 0,
+    ):
+        self.chains = chains or list(Chains)
+        self.methods = methods or DEFAULT_METHOD_MIX
+        self.random = random.Random(seed)
+        self.next_id = 0
+
+    def params(self, method: str) -> list:
+        address = self.random.choice(ADDRESSES)
+        block = hex(1_000_000 + self.random.randrange(5_000))
+        if method == "eth_getBalance":
+            return [address, self.random.choice(["latest", block])]
+        if method == "eth_call":
+            return [{"to": address, "data": "0x70a08231"}, "latest"]
+        if method == "eth_getBlockByNumber":
+            return [self.random.choice(["latest", block]), False]
+        if method == "eth_getTransactionReceipt":
+            return [f"0x{self.random.randrange(10_000):064x}"]
+        return []
+
+    def __next__(self) -> dict:
+        method = self.random.choices(
+            list(self.methods), weights=list(self.methods.values())
+        )[0]
+        self.next_id += 1
+        call = {
+            "jsonrpc": "2.0",
+            "id": self.next_id,
+            "method": method,
+            "params": self.params(method),
+        }
+        return {
+            "chain_id": self.random.choice(self.chains).value,
+            "payload": json.dumps(call),
+        }
+
+    def __iter__(self):
+        return self
+
+
+class MockUpstream:
+    """JSON-RPC node stand-in with tunable latency and error distributions.
+
+    Each chain is served on `/<chain id>`. Latency is log-normal around `latency`,
+    `error_rate` of the calls fail with a 503 and `rpc_error_rate` with a JSON-RPC error.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rpc_error_rate: float = 0.0,
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rpc_error_rate = rpc_error_rate
+        self.port = port
+        self.calls = Counter()
+        self.started = time.monotonic()
+        self.runner = None
+
+    def url(self, chain: Chains) -> str:
+        return f"http://127.0.0.1:{self.port}/{chain.value}"
+
+    def head(self, chain: Chains) -> int:
+        elapsed = time.monotonic() - self.started
+        return 1_005_000 + int(elapsed / BLOCK_TIMES[chain])
+
+    def result(self, chain: Chains, call: dict):
+        method = call.get("method")
+        params = call.get("params") or []
+        if method == "eth_blockNumber":
+            return hex(self.head(chain))
+        if method == "eth_chainId":
+            return hex(list(Chains).index(chain) + 1)
+        if method == "eth_gasPrice":
+            return hex(1_000_000_000 + self.head(chain) % 100)
+        if method == "eth_getBalance":
+            return hex(int(params[0], 16) * 10**15)
+        if method == "eth_call":
+            return "0x" + "0" * 63 + "1"
+        if method == "eth_getBlockByNumber":
+            tag = params[0] if params else "latest"
+            number = self.head(chain) if tag == "latest" else int(tag, 16)
+            return {
+                "number": hex(number),
+                "hash": f"0x{number:064x}",
+                "transactions": [],
+            }
+        if method == "eth_getTransactionReceipt":
+            return {
+                "transactionHash": params[0],
+                "blockNumber": hex(1_000_000),
+                "status": "0x1",
+            }
+        if method == "eth_getLogs":
+            return []
+        return None
+
+    def answer(self, chain: Chains, call: dict) -> dict:
+        if random.random() < self.rpc_error_rate:
+            return {
+                "jsonrpc": "2.0",
+                "id": call.get("id"),
+                "error": {"code": -32000, "message": "mock upstream error"},
+            }
+        return {
+            "jsonrpc": "2.0",
+            "id": call.get("id"),
+            "result": self.result(chain, call),
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        chain = Chains(request.match_info["chain"])
+        self.calls[chain] += 1
+        await asyncio.sleep(random.lognormvariate(np.log(self.latency), self.sigma))
+        if random.random() < self.error_rate:
+            return web.Response(status=503, text="mock upstream unavailable")
+        body = await request.json()
+        if isinstance(body, list):
+            answer = [self.answer(chain, call) for call in body if "id" in call]
+        else:
+            answer = self.answer(chain, body)
+        return web.json_response(answer)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/{chain}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+class EntrypointServer:
+    """Entrypoint websocket stand-in pushing a request mix to a connected validator.
+
+    Keeps `concurrency` requests outstanding until `total` replies were received,
+    and records the latency of every reply by its envelope id.
+    """
+
+    def __init__(self, mix: RequestMix, total: int, concurrency: int, port: int = 0):
+        self.mix = mix
+        self.total = total
+        self.concurrency = concurrency
+        self.port = port
+        self.sent: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.done = asyncio.Event()
+        self.started = None
+        self.finished = None
+        self.server = None
+
+    @property
+    def uri(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    async def send(self, websocket, envelope_id: int):
+        self.sent[envelope_id] = time.monotonic()
+        await websocket.send(json.dumps(dict(next(self.mix), id=envelope_id)))
+
+    async def handler(self, websocket, *args):
+        self.started = time.monotonic()
+        next_id = 0
+        for _ in range(min(self.concurrency, self.total)):
+            await self.send(websocket, next_id)
+            next_id += 1
+        async for message in websocket:
+            reply = json.loads(message)
+            sent = self.sent.pop(reply["id"], None)
+            if sent is None:
+                continue
+            self.latencies.append(time.monotonic() - sent)
+            if "error" in reply:
+                self.errors += 1
+            if len(self.latencies) >= self.total:
+                self.finished = time.monotonic()
+                self.done.set()
+                await websocket.close()
+                return
+            if next_id < self.total:
+                await self.send(websocket, next_id)
+                next_id += 1
+
+    async def start(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", self.port)
+        self.port = next(iter(self.server.sockets)).getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class FakeMetagraph:
+    """Metagraph stand-in with n serving uids, uid 0 being the validator."""
+
+    def __init__(self, n: int):
+        self.n = np.int64(n)
+        self.hotkeys = [f"hotkey-{uid}" for uid in range(n)]
+        self.uids = np.arange(n)
+        self.S = np.ones(n)
+        self.I = np.zeros(n)
+        self.block = np.int64(0)
+        self.axons = [SimpleNamespace(uid=uid, is_serving=uid > 0) for uid in range(n)]
+
+    def sync(self, *args, **kwargs):
+        pass
+
+
+class FakeSubtensor:
+    def __init__(self, metagraph: Optional[FakeMetagraph] = None):
+        self.graph = metagraph
+        self.weights = []
+
+    def metagraph(self, netuid: int) -> Optional[FakeMetagraph]:
+        return self.graph
+
+    def set_weights(self, **kwargs):
+        self.weights.append(kwargs["weights"])
+        return True, ""
+
+
+class FakeBlockTracker:
+    """Block tracker stand-in advancing one block per block time, without a chain."""
+
+    def __init__(self, tempo: int = 360, block_time: float = 12.0):
+        self.tempo = tempo
+        self.block_time = block_time
+        self.started = time.monotonic()
+        self.last_update = []
+
+    @property
+    def current_block(self) -> int:
+        return int((time.monotonic() - self.started) / self.block_time)
+
+    def refresh(self) -> bool:
+        return True
+
+    def blocks_since_update(self, uid: int) -> Optional[int]:
+        return 0
+
+    def mark_updated(self, uid: int):
+        pass
+
+    def start(self):
+        pass
+
+
+class InProcessDendrite:
+    """Dendrite stand-in delivering synapses straight to in-process miners.
+
+    `network_latency` seconds are added to every call to stand in for the hop
+    between validator and miner.
+    """
+
+    def __init__(self, miners: Dict[int, object], network_latency: float = 0.005):
+        self.miners = miners
+        self.network_latency = network_latency
+
+    async def call(self, target_axon, synapse, timeout=12.0, deserialize=True):
+        miner = self.miners[target_axon.uid]
+
+        async def roundtrip():
+            await asyncio.sleep(self.network_latency / 2)
+            response = await miner.handle_blockchain_request(synapse)
+            await asyncio.sleep(self.network_latency / 2)
+            return response
+
+        try:
+            return await asyncio.wait_for(roundtrip(), timeout)
+        except asyncio.TimeoutError:
+            return synapse
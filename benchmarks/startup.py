@@ -0,0 +1,99 @@
+"""Startup cost of the neurons: import time and resident memory.
+
+Each module is imported in a fresh interpreter, the best of `--repeat` runs is
+reported. With limits given, exits non-zero when one is exceeded, for CI.
+
+Usage, from the repository root:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --max_import_seconds 5 --max_rss_mb 400
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+# Runs in the child interpreter, before anything else is imported.
+PROBE = """
+import sys, json, time, resource
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "import_seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "loaded": sorted(m for m in {forbidden!r} if m in sys.modules),
+}}))
+"""
+
+
+def measure(module: str, forbidden: list) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, forbidden=forbidden)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(config) -> int:
+    failures = []
+    report = {}
+    for module in config.modules:
+        runs = [measure(module, config.forbid) for _ in range(config.repeat)]
+        best = {
+            "import_seconds": round(min(run["import_seconds"] for run in runs), 3),
+            "rss_mb": round(min(run["rss_mb"] for run in runs), 1),
+            "modules": runs[0]["modules"],
+            "forbidden_loaded": runs[0]["loaded"],
+        }
+        report[module] = best
+        if best["forbidden_loaded"]:
+            failures.append(f"{module} imports {', '.join(best['forbidden_loaded'])}")
+        if config.max_import_seconds and (
+            best["import_seconds"] > config.max_import_seconds
+        ):
+            failures.append(
+                f"{module} takes {best['import_seconds']}s to import, "
+                f"limit {config.max_import_seconds}s"
+            )
+        if config.max_rss_mb and best["rss_mb"] > config.max_rss_mb:
+            failures.append(
+                f"{module} uses {best['rss_mb']} MB after import, "
+                f"limit {config.max_rss_mb} MB"
+            )
+    print(json.dumps({"benchmark": "startup", "modules": report}, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def get_config():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["validator", "miner"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--forbid",
+        nargs="*",
+        default=["torch"],
+        help="Modules that must not be loaded by the neurons.",
+    )
+    parser.add_argument(
+        "--max_import_seconds",
+        type=float,
+        default=0,
+        help="Fail above this import time, 0 disables the check.",
+    )
+    parser.add_argument(
+        "--max_rss_mb",
+        type=float,
+        default=0,
+        help="Fail above this resident memory after import, 0 disables the check.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(get_config()))
@@ -1,11 +1,108 @@
 import os
+import json
+import asyncio
 import time
 import argparse
 import traceback
 import bittensor as bt
+from collections import defaultdict
 from typing import Tuple
 from protocol import BlockchainRequest, Chains
-import requests
+from utils.upstream import (
+    NON_IDEMPOTENT_METHODS,
+    UpstreamClient,
+    UpstreamRegistry,
+    is_idempotent,
+)
+from utils.rpc_cache import (
+    BLOCK_PARAM_METHODS,
+    HEAD_METHODS,
+    IMMUTABLE_METHODS,
+    INCLUDED_METHODS,
+    RANGE_METHODS,
+    ResponseCache,
+)
+from utils.jsonrpc import (
+    call_key,
+    dumps,
+    error_response,
+    parse_batch,
+    parse_call,
+    with_id,
+)
+from utils.singleflight import SingleFlight
+from utils.admission import AdaptiveLimit, Overloaded
+from utils.encoding import encode, negotiate
+from utils.head_tracker import HeadTracker
+from utils.logs import LogsSplitter
+from utils.metrics import REGISTRY, start_http_server
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "miner_upstream_seconds",
+    "Time spent on an upstream call.",
+    labels=("chain", "method"),
+)
+# Method label values, bounded since the payload comes from the public entrypoint.
+METRIC_METHODS = (
+    IMMUTABLE_METHODS
+    | HEAD_METHODS
+    | set(BLOCK_PARAM_METHODS)
+    | RANGE_METHODS
+    | INCLUDED_METHODS
+    | NON_IDEMPOTENT_METHODS
+    | {
+        "eth_feeHistory",
+        "eth_syncing",
+        "eth_accounts",
+        "eth_newFilter",
+        "eth_newBlockFilter",
+        "eth_getFilterChanges",
+        "eth_getFilterLogs",
+        "eth_uninstallFilter",
+        "net_listening",
+        "net_peerCount",
+        "web3_clientVersion",
+    }
+)
+
+
+def metric_method(method) -> str:
+    return method if method in METRIC_METHODS else "other"
+
+
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "miner_upstream_errors",
+    "Upstream calls failing or answering with an error status.",
+    labels=("chain",),
+)
+REQUESTS = REGISTRY.counter("miner_requests", "Requests served.", labels=("outcome",))
+IN_FLIGHT = REGISTRY.gauge("miner_in_flight", "Requests being served.")
+BLACKLISTED = REGISTRY.counter(
+    "miner_blacklisted", "Requests rejected from unrecognized hotkeys."
+)
+REJECTED = REGISTRY.counter(
+    "miner_rejected", "Requests rejected while overloaded.", labels=("chain",)
+)
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "miner_concurrency_limit",
+    "Adaptive limit of concurrent upstream calls.",
+    labels=("chain",),
+)
+CACHE_HITS = REGISTRY.counter("miner_cache_hits", "Calls answered from the cache.")
+CACHE_MISSES = REGISTRY.counter("miner_cache_misses", "Cache lookups missed.")
+CACHE_BYTES = REGISTRY.gauge("miner_cache_bytes", "Size of the cached responses.")
+COMPRESSION_SAVED = REGISTRY.counter(
+    "miner_compression_saved_bytes", "Response bytes saved by compression."
+)
+HEAD_ANSWERS = REGISTRY.counter(
+    "miner_head_answers", "Tip-state calls answered by the head tracker."
+)
+LOGS_SPLIT = REGISTRY.counter(
+    "miner_logs_split", "eth_getLogs calls split into sub-ranges."
+)
+COALESCED = REGISTRY.counter(
+    "miner_coalesced", "Calls sharing an identical in-flight upstream call."
+)
 
 
 class Miner:
@@ -13,6 +110,7 @@ class Miner:
         self.config = self.get_config()
         self.setup_logging()
         self.setup_bittensor_objects()
+        self.index_hotkeys()
         self.infura_endpoints = {
             Chains.ETH_MAINNET: f"https://mainnet.infura.io/v3/{self.config.infura_api_key}",
             Chains.ETH_SEPOLIA: f"https://sepolia.infura.io/v3/{self.config.infura_api_key}",
@@ -29,6 +127,85 @@ class Miner:
             Chains.BASE_SEPOLIA: f"https://base-sepolia.infura.io/v3/{self.config.infura_api_key}",
             # Add more chains as needed
         }
+        self.cache = ResponseCache(max_bytes=self.config.cache_size_mb * 1024 * 1024)
+        self.in_flight = SingleFlight()
+        self.limits = defaultdict(
+            lambda: AdaptiveLimit(
+                initial=self.config.upstream_concurrency,
+                max_limit=self.config.upstream_max_concurrency,
+                max_queue=self.config.upstream_queue_size,
+            )
+        )
+        self.setup_upstreams()
+        self.setup_metrics()
+
+    def setup_metrics(self):
+        # Totals kept by the cache and the coalescer are read at scrape time.
+        CACHE_HITS.set_function(lambda: self.cache.hits)
+        CACHE_MISSES.set_function(lambda: self.cache.misses)
+        CACHE_BYTES.set_function(lambda: self.cache.size)
+        COALESCED.set_function(lambda: self.in_flight.shared)
+        if self.heads is not None:
+            HEAD_ANSWERS.set_function(lambda: self.heads.answered)
+        if self.logs is not None:
+            LOGS_SPLIT.set_function(lambda: self.logs.split)
+        for chain in self.upstreams.chains:
+            limit = self.limits[chain]
+            CONCURRENCY_LIMIT.labels(chain.value).set_function(
+                lambda limit=limit: int(limit.limit)
+            )
+        start_http_server(self.config.metrics_port)
+
+    def setup_upstreams(self):
+        # Infura serves every chain when a key is given, next to any configured upstreams.
+        endpoints = UpstreamRegistry.parse_endpoints(
+            self.config.upstreams, self.config.upstreams_file
+        )
+        if self.config.infura_api_key:
+            for chain, url in self.infura_endpoints.items():
+                endpoints.setdefault(chain, []).append(url)
+        self.upstream = UpstreamClient(
+            pool_size=self.config.upstream_pool_size,
+            connect_timeout=self.config.upstream_connect_timeout,
+            read_timeout=self.config.upstream_read_timeout,
+            retries=self.config.upstream_retries,
+        )
+        self.upstreams = UpstreamRegistry(
+            self.upstream,
+            endpoints,
+            probe_interval=self.config.upstream_probe_interval,
+            max_lag=self.config.upstream_max_lag,
+            head_listener=self.cache.observe_head,
+            idle_timeout=self.config.upstream_idle_timeout,
+        )
+        for chain, upstreams in self.upstreams.upstreams.items():
+            bt.logging.info(
+                f"Upstreams for {chain.value}: {len(upstreams)} endpoint(s)"
+            )
+        self.heads = None
+        if self.config.head_max_lag_blocks > 0:
+            self.heads = HeadTracker(
+                self.post_head,
+                self.upstreams.chains,
+                max_lag_blocks=self.config.head_max_lag_blocks,
+                head_listener=self.cache.observe_head,
+                min_interval=self.config.head_min_interval,
+                idle_timeout=self.config.head_idle_timeout,
+            )
+
+        self.logs = None
+        if self.config.logs_max_span > 0:
+            self.logs = LogsSplitter(
+                self.post_upstream,
+                self.cache,
+                max_span=self.config.logs_max_span,
+                concurrency=self.config.logs_concurrency,
+                max_parts=self.config.logs_max_parts,
+            )
+
+    def post_head(self, chain: Chains, payload: str):
+        # Head polls jump the admission queue, a stale head only adds upstream load.
+        return self.post_upstream(chain, payload, "head", True, float("inf"))
 
     def get_config(self):
         # Set up the configuration parser
@@ -40,6 +217,133 @@ class Miner:
             type=str,
             help="Infura API key.",
         )
+        parser.add_argument(
+            "--upstreams",
+            type=str,
+            nargs="*",
+            default=[],
+            help="Additional upstream endpoints given as chain=url, e.g. eth-mainnet=http://localhost:8545.",
+        )
+        parser.add_argument(
+            "--upstreams_file",
+            type=str,
+            default=None,
+            help="JSON file mapping chain ids to lists of upstream urls.",
+        )
+        parser.add_argument(
+            "--upstream_probe_interval",
+            type=float,
+            default=10.0,
+            help="Seconds between upstream health and head probes.",
+        )
+        parser.add_argument(
+            "--upstream_idle_timeout",
+            type=float,
+            default=60.0,
+            help="Seconds without requests after which a chain's upstreams are no longer probed.",
+        )
+        parser.add_argument(
+            "--upstream_max_lag",
+            type=float,
+            default=30.0,
+            help="Seconds an upstream may lag behind the best known head before it is avoided.",
+        )
+        parser.add_argument(
+            "--upstream_pool_size",
+            type=int,
+            default=100,
+            help="Maximum number of pooled connections per upstream endpoint.",
+        )
+        parser.add_argument(
+            "--upstream_connect_timeout",
+            type=float,
+            default=3.0,
+            help="Seconds to wait for an upstream connection.",
+        )
+        parser.add_argument(
+            "--upstream_read_timeout",
+            type=float,
+            default=10.0,
+            help="Seconds to wait for upstream response data.",
+        )
+        parser.add_argument(
+            "--upstream_retries",
+            type=int,
+            default=2,
+            help="Retries with backoff for idempotent upstream calls.",
+        )
+        parser.add_argument(
+            "--cache_size_mb",
+            type=int,
+            default=64,
+            help="Memory bound of the JSON-RPC response cache, 0 disables it.",
+        )
+        parser.add_argument(
+            "--upstream_concurrency",
+            type=int,
+            default=32,
+            help="Initial limit of concurrent upstream calls per chain, adapted to upstream latency and 429s.",
+        )
+        parser.add_argument(
+            "--upstream_max_concurrency",
+            type=int,
+            default=512,
+            help="Upper bound of the adaptive per-chain upstream concurrency limit.",
+        )
+        parser.add_argument(
+            "--upstream_queue_size",
+            type=int,
+            default=64,
+            help="Requests per chain waiting for an upstream slot before new ones are rejected.",
+        )
+        parser.add_argument(
+            "--head_max_lag_blocks",
+            type=float,
+            default=2.0,
+            help="Poll intervals after the last head poll during which tip-state calls are answered locally, 0 disables the head tracker.",
+        )
+        parser.add_argument(
+            "--head_min_interval",
+            type=float,
+            default=1.0,
+            help="Minimum seconds between two head polls of a chain, for chains with faster blocks.",
+        )
+        parser.add_argument(
+            "--head_idle_timeout",
+            type=float,
+            default=60.0,
+            help="Seconds without tip-state calls after which a chain's head is no longer polled.",
+        )
+        parser.add_argument(
+            "--logs_max_span",
+            type=int,
+            default=2000,
+            help="eth_getLogs calls spanning more blocks are split into sub-ranges of this size, 0 disables splitting.",
+        )
+        parser.add_argument(
+            "--logs_concurrency",
+            type=int,
+            default=8,
+            help="Sub-ranges of one split eth_getLogs call fetched concurrently.",
+        )
+        parser.add_argument(
+            "--logs_max_parts",
+            type=int,
+            default=64,
+            help="eth_getLogs calls needing more sub-ranges are sent upstream unsplit.",
+        )
+        parser.add_argument(
+            "--compress_min_bytes",
+            type=int,
+            default=16384,
+            help="Responses at least this large are compressed when the validator accepts an encoding, 0 disables compression.",
+        )
+        parser.add_argument(
+            "--metrics_port",
+            type=int,
+            default=0,
+            help="Port serving Prometheus metrics on /metrics, 0 disables the endpoint.",
+        )
         # Adds override arguments for network and netuid.
         parser.add_argument(
             "--netuid", type=int, default=1, help="The chain subnet uid."
@@ -104,9 +408,16 @@ class Miner:
             )
             bt.logging.info(f"Running miner on uid: {self.my_subnet_uid}")
 
+    def index_hotkeys(self):
+        # Hotkey lookups on the request path are dict hits, rebuilt on every sync.
+        self.hotkey_uids = {
+            hotkey: uid for uid, hotkey in enumerate(self.metagraph.hotkeys)
+        }
+
     def blacklist_fn(self, synapse: BlockchainRequest) -> Tuple[bool, str]:
         # Ignore requests from unrecognized entities.
-        if synapse.dendrite.hotkey not in self.metagraph.hotkeys:
+        if synapse.dendrite.hotkey not in self.hotkey_uids:
+            BLACKLISTED.inc()
             bt.logging.trace(
                 f"Blacklisting unrecognized hotkey {synapse.dendrite.hotkey}"
             )
@@ -116,27 +427,196 @@ class Miner:
         )
         return False, None
 
-    def handle_blockchain_request(
+    def priority_fn(self, synapse: BlockchainRequest) -> float:
+        # Validators with more stake are served first when upstream slots run out.
+        uid = self.hotkey_uids.get(synapse.dendrite.hotkey)
+        if uid is None:
+            return 0.0
+        return float(self.metagraph.S[uid])
+
+    async def post_upstream(
+        self,
+        chain: Chains,
+        payload: str,
+        method: str,
+        idempotent: bool,
+        priority: float = 0.0,
+        spread: int = 0,
+    ):
+        # Every upstream call goes through here to be admitted, and timed per chain
+        # and method.
+        limit = self.limits[chain]
+        try:
+            await limit.acquire(priority)
+        except Overloaded:
+            REJECTED.labels(chain.value).inc()
+            raise
+        start = time.perf_counter()
+        status = None
+        try:
+            status, body = await self.upstreams.post(
+                chain, payload, idempotent=idempotent, spread=spread
+            )
+        except Exception:
+            UPSTREAM_ERRORS.labels(chain.value).inc()
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            UPSTREAM_SECONDS.labels(chain.value, method).observe(latency)
+            limit.record(latency, throttled=status == 429)
+            limit.release()
+        if status != 200:
+            UPSTREAM_ERRORS.labels(chain.value).inc()
+        return status, body
+
+    async def handle_blockchain_request(
         self, synapse: BlockchainRequest
     ) -> BlockchainRequest:
+        IN_FLIGHT.inc()
+        try:
+            # Upstream calls and retries stop once the validator has given up, and
+            # their admission slots are released.
+            try:
+                synapse = await asyncio.wait_for(self.serve(synapse), synapse.timeout)
+            except asyncio.TimeoutError:
+                synapse.error = "Upstream request timed out"
+            await self.compress(synapse)
+            return synapse
+        finally:
+            IN_FLIGHT.dec()
+            REQUESTS.labels("error" if synapse.error else "success").inc()
+
+    async def compress(self, synapse: BlockchainRequest):
+        # Large bodies are compressed in an encoding the validator accepts.
+        response = synapse.response
+        min_bytes = self.config.compress_min_bytes
+        if response is None or not min_bytes or len(response) < min_bytes:
+            return
+        encoding = negotiate(synapse.accept_encoding)
+        if encoding is None:
+            return
+        if len(response) >= 1024 * 1024:
+            # zlib releases the GIL, keep the event loop free on very large bodies.
+            encoded = await asyncio.to_thread(encode, response, encoding)
+        else:
+            encoded = encode(response, encoding)
+        if len(encoded) < len(response):
+            synapse.response = encoded
+            synapse.response_encoding = encoding
+            COMPRESSION_SAVED.inc(len(response) - len(encoded))
+
+    async def serve(self, synapse: BlockchainRequest) -> BlockchainRequest:
         try:
             chain = Chains(synapse.chain_id)
-            if chain not in self.infura_endpoints:
+            if chain not in self.upstreams.chains:
                 raise ValueError(f"Unsupported chain: {synapse.chain_id}")
+            self.upstreams.start(chain)
 
-            endpoint = self.infura_endpoints[chain]
-            response = requests.post(endpoint, data=synapse.payload)
+            priority = self.priority_fn(synapse)
+            calls = parse_batch(synapse.payload)
+            if calls is not None:
+                synapse.response = await self.handle_batch(chain, calls, priority)
+                return synapse
 
-            if response.status_code == 200:
-                synapse.response = response.text
-            else:
-                synapse.error = (
-                    f"Infura request failed with status {response.status_code}"
+            # Serve tip, immutable and current-block results without an upstream call.
+            call = parse_call(synapse.payload)
+            if call is not None:
+                cached = self.lookup(chain, call)
+                if cached is not None:
+                    synapse.response = cached
+                    return synapse
+                if self.logs is not None and call["method"] == "eth_getLogs":
+                    parts = self.logs.parts(chain, call)
+                    if parts is not None:
+                        synapse.response = await self.logs.fetch(
+                            chain, call, parts, priority
+                        )
+                        return synapse
+
+            idempotent = is_idempotent(synapse.payload)
+
+            method = metric_method(call["method"]) if call is not None else "unknown"
+
+            def post():
+                return self.post_upstream(
+                    chain, synapse.payload, method, idempotent, priority
+                )
+
+            if call is not None and idempotent:
+                # Identical calls already in flight share a single upstream request.
+                (status, body), shared = await self.in_flight.do(
+                    call_key(chain.value, call), post
                 )
+                if shared:
+                    body = with_id(body, call.get("id"))
+            else:
+                (status, body), shared = await post(), False
+
+            if status == 200:
+                synapse.response = body
+                # The leader of a coalesced call already filled the cache.
+                if call is not None and not shared:
+                    self.cache.put(chain, call, body)
+            else:
+                synapse.error = f"Upstream request failed with status {status}"
         except Exception as e:
             synapse.error = str(e)
         return synapse
 
+    def lookup(self, chain: Chains, call: dict):
+        # The head tracker knows the tip before the cache sees the next block.
+        if self.heads is not None:
+            response = self.heads.answer(chain, call)
+            if response is not None:
+                return response
+        return self.cache.get(chain, call)
+
+    async def handle_batch(self, chain: Chains, calls, priority: float = 0.0) -> str:
+        # Members answered locally never reach the upstream.
+        responses = [None] * len(calls)
+        missing = []
+        for i, call in enumerate(calls):
+            if "id" not in call:
+                # Notifications get no response.
+                missing.append((i, call))
+                continue
+            responses[i] = self.lookup(chain, call)
+            if responses[i] is None:
+                missing.append((i, call))
+
+        if missing:
+            # The rest goes upstream as one batch, with positions as ids to match results.
+            payload = dumps(
+                [dict(call, id=i) if "id" in call else call for i, call in missing]
+            )
+            status, body = await self.post_upstream(
+                chain, payload, "batch", is_idempotent(payload), priority
+            )
+            if status != 200:
+                raise ValueError(f"Upstream request failed with status {status}")
+            results = json.loads(body)
+            if not isinstance(results, list):
+                raise ValueError(f"Upstream rejected batch: {body[:200]}")
+            by_position = {
+                result.get("id"): result
+                for result in results
+                if isinstance(result, dict)
+            }
+            for i, call in missing:
+                if "id" not in call:
+                    continue
+                result = by_position.get(i)
+                if result is None:
+                    responses[i] = error_response(
+                        call["id"], "Missing response from upstream"
+                    )
+                    continue
+                self.cache.store(chain, call, result)
+                result["id"] = call["id"]
+                responses[i] = dumps(result)
+
+        return "[" + ",".join(r for r in responses if r is not None) + "]"
+
     def setup_axon(self):
         # Build and link miner functions to the axon.
         self.axon = bt.axon(wallet=self.wallet, port=self.config.axon.port)
@@ -146,6 +626,7 @@ class Miner:
         self.axon.attach(
             forward_fn=self.handle_blockchain_request,
             blacklist_fn=self.blacklist_fn,
+            priority_fn=self.priority_fn,
         )
 
         # Serve the axon.
@@ -170,9 +651,12 @@ class Miner:
                 # Periodically update our knowledge of the network graph.
                 if step % 60 == 0:
                     self.metagraph.sync()
+                    self.index_hotkeys()
                     log = (
                         f"Block: {self.metagraph.block.item()} | "
                         f"Incentive: {self.metagraph.I[self.my_subnet_uid]} | "
+                        f"{self.cache.stats()} | "
+                        f"Coalesced: {self.in_flight.shared}"
                     )
                     bt.logging.info(log)
                 step += 1
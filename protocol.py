@@ -18,6 +18,42 @@ class Chains(Enum):
     BASE_MAINNET = "base-mainnet"
     BASE_SEPOLIA = "base-sepolia"
 
+
+# Average seconds between blocks.
+BLOCK_TIMES = {
+    Chains.ETH_MAINNET: 12.0,
+    Chains.ETH_SEPOLIA: 12.0,
+    Chains.LINEA_MAINNET: 2.0,
+    Chains.LINEA_SEPOLIA: 2.0,
+    Chains.POLYGON_MAINNET: 2.0,
+    Chains.OPTIMISM_MAINNET: 2.0,
+    Chains.OPTIMISM_SEPOLIA: 2.0,
+    Chains.ARBITRUM_MAINNET: 0.25,
+    Chains.ARBITRUM_SEPOLIA: 0.25,
+    Chains.AVALANCHE_MAINNET: 2.0,
+    Chains.AVALANCHE_FUJI: 2.0,
+    Chains.BASE_MAINNET: 2.0,
+    Chains.BASE_SEPOLIA: 2.0,
+}
+
+# Blocks behind the head after which a block is not expected to reorg.
+FINALITY_DEPTHS = {
+    Chains.ETH_MAINNET: 64,
+    Chains.ETH_SEPOLIA: 64,
+    Chains.LINEA_MAINNET: 64,
+    Chains.LINEA_SEPOLIA: 64,
+    Chains.POLYGON_MAINNET: 256,
+    Chains.OPTIMISM_MAINNET: 64,
+    Chains.OPTIMISM_SEPOLIA: 64,
+    Chains.ARBITRUM_MAINNET: 240,
+    Chains.ARBITRUM_SEPOLIA: 240,
+    Chains.AVALANCHE_MAINNET: 1,
+    Chains.AVALANCHE_FUJI: 1,
+    Chains.BASE_MAINNET: 64,
+    Chains.BASE_SEPOLIA: 64,
+}
+
+
 class BlockchainRequest(bt.Synapse):
     """
     A protocol for generic blockchain requests between
@@ -27,7 +63,11 @@ class BlockchainRequest(bt.Synapse):
     # Required request input, filled by the dendrite caller (validator).
     chain_id: str
     payload: str
+    # Response encodings the caller can decode, see utils/encoding.py.
+    accept_encoding: typing.List[str] = []
 
     # Optional request output, filled by the axon responder (miner).
     response: typing.Optional[str] = None
-    error: typing.Optional[str] = None
\ No newline at end of file
+    error: typing.Optional[str] = None
+    # Encoding of the response, None if it is sent as is.
+    response_encoding: typing.Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,115 @@
+import time
+import heapq
+import asyncio
+import itertools
+from typing import List
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdaptiveLimit:
+    """Concurrency limit of the upstream calls of one chain, adapted AIMD style.
+
+    The limit grows by one for every `limit` calls completed at capacity. It shrinks
+    multiplicatively when the upstream throttles with a 429, or when the p90 latency
+    of the last `window` calls climbs `tolerance` times above its usual value, so
+    ordinary latency spread alone never shrinks it. Calls above the limit
+    wait in a queue ordered by priority, callers finding the queue full are rejected
+    at once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 32,
+        min_limit: int = 4,
+        max_limit: int = 512,
+        max_queue: int = 64,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        window: int = 50,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+        self.latencies: List[float] = []
+        self.congested = False
+        self.in_flight = 0
+        self.waiters: List[list] = []
+        self.order = itertools.count()
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.rejected = 0
+
+    async def acquire(self, priority: float = 0.0):
+        """Takes a slot, waiting behind higher priority callers if the limit is reached.
+        Args:
+            priority (float): Callers with a higher priority are let through first.
+        Raises:
+            Overloaded: If the wait queue is full.
+        """
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Miner overloaded")
+        future = asyncio.get_running_loop().create_future()
+        entry = [-priority, next(self.order), future]
+        heapq.heappush(self.waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation.
+                self.release()
+            elif entry in self.waiters:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def record(self, latency: float, throttled: bool = False):
+        """Adapts the limit to the outcome of a call, before its slot is released.
+        Args:
+            latency (float): Seconds the upstream call took.
+            throttled (bool): Whether the upstream answered with a 429.
+        """
+        now = time.monotonic()
+        if throttled and now - self.last_decrease >= latency:
+            # Calls started before a decrease report the same throttling, skip them.
+            self.limit = max(self.min_limit, self.limit * 0.5)
+            self.last_decrease = now
+            return
+
+        self.latencies.append(latency)
+        if len(self.latencies) >= self.window:
+            self.latencies.sort()
+            p90 = self.latencies[int(len(self.latencies) * 0.9)]
+            self.latencies.clear()
+            if self.baseline is None:
+                self.baseline = p90
+            self.congested = p90 > self.baseline * self.tolerance
+            if self.congested:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            # Follow faster windows quickly, and an upstream that became slower for
+            # good slowly, so congestion does not become the new normal.
+            rate = 0.5 if p90 < self.baseline else 0.01
+            self.baseline += rate * (p90 - self.baseline)
+
+        if not self.congested and self.in_flight >= int(self.limit):
+            # Only grow a limit that is actually reached.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.jsonrpc import dumps
+
+# Answer of a forwarded payload: the response body, or an error message.
+Reply = Tuple[Optional[str], Optional[str]]
+
+
+class RequestBatcher:
+    """Groups concurrent JSON-RPC calls on the same chain into one batched payload.
+
+    Calls arriving within `window` seconds of each other, up to `max_size` of them,
+    are forwarded together and each caller receives its own member of the reply.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[str, str], Awaitable[Reply]],
+        window: float = 0.01,
+        max_size: int = 20,
+    ):
+        self.forward = forward
+        self.window = window
+        self.max_size = max_size
+        self.pending: Dict[str, List[Tuple[dict, asyncio.Future]]] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.tasks = set()
+
+    async def submit(self, chain_id: str, call: dict) -> Reply:
+        """Queues a call for the next batch of its chain.
+        Args:
+            chain_id (str): Chain the call is made on.
+            call (dict): Decoded JSON-RPC call carrying an id.
+        Returns:
+            response (str): JSON-RPC response to the call, None on failure.
+            error (str): Error message if the batch could not be served.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.setdefault(chain_id, [])
+        batch.append((call, future))
+        if len(batch) >= self.max_size:
+            self.flush(chain_id)
+        elif len(batch) == 1:
+            self.timers[chain_id] = loop.call_later(self.window, self.flush, chain_id)
+        return await future
+
+    def flush(self, chain_id: str):
+        timer = self.timers.pop(chain_id, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(chain_id, None)
+        if batch:
+            task = asyncio.create_task(self.send(chain_id, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def send(self, chain_id: str, batch: List[Tuple[dict, asyncio.Future]]):
+        if len(batch) == 1:
+            call, future = batch[0]
+            payload = dumps(call)
+        else:
+            # Positions replace the caller ids, which may collide across callers.
+            payload = dumps([dict(call, id=i) for i, (call, _) in enumerate(batch)])
+        try:
+            response, error = await self.forward(chain_id, payload)
+        except Exception as e:
+            response, error = None, str(e)
+
+        if len(batch) == 1:
+            if not future.done():
+                future.set_result((response, error))
+            return
+
+        members = {}
+        if response is not None and error is None:
+            try:
+                results = json.loads(response)
+            except ValueError:
+                results = None
+            if isinstance(results, list):
+                members = {
+                    result.get("id"): result
+                    for result in results
+                    if isinstance(result, dict)
+                }
+            else:
+                error = "Invalid batch response"
+        for i, (call, future) in enumerate(batch):
+            if future.done():
+                continue
+            member = members.get(i)
+            if member is None:
+                future.set_result((None, error or "Missing response in batch"))
+                continue
+            member["id"] = call["id"]
+            future.set_result((dumps(member), None))
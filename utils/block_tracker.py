@@ -0,0 +1,83 @@
+import asyncio
+import bittensor as bt
+from typing import List, Optional
+from substrateinterface import SubstrateInterface
+from utils.metrics import REGISTRY
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "substrate_query_seconds", "Time spent querying the subtensor.", labels=("method",)
+)
+
+
+class BlockTracker:
+    """Keeps the current block and the subnet's LastUpdate and Tempo cached in memory.
+
+    A background task polls the chain from a worker thread, so the request path only
+    reads plain attributes and never waits on the subtensor endpoint.
+    """
+
+    def __init__(self, chain_endpoint: str, netuid: int, interval: float = 12.0):
+        self.chain_endpoint = chain_endpoint
+        self.netuid = netuid
+        self.interval = interval
+        self.node = None
+        self.task = None
+        self.current_block = 0
+        self.tempo = 0
+        self.last_update: List[int] = []
+
+    def query(self, module, method, params):
+        with QUERY_SECONDS.labels(method).time():
+            return self.query_node(module, method, params)
+
+    def query_node(self, module, method, params):
+        try:
+            if self.node is None:
+                self.node = SubstrateInterface(url=self.chain_endpoint)
+            result = self.node.query(module, method, params).value
+
+        except Exception:
+            # reinitilize node
+            self.node = SubstrateInterface(url=self.chain_endpoint)
+            result = self.node.query(module, method, params).value
+
+        return result
+
+    def refresh(self) -> bool:
+        """Reads the chain state, skipping the subnet queries if no block was produced.
+        Returns:
+            bool: True if a new block was seen.
+        """
+        current_block = self.query("System", "Number", [])
+        if current_block == self.current_block:
+            return False
+        self.last_update = self.query("SubtensorModule", "LastUpdate", [self.netuid])
+        self.tempo = self.query("SubtensorModule", "Tempo", [self.netuid])
+        self.current_block = current_block
+        return True
+
+    def blocks_since_update(self, uid: int) -> Optional[int]:
+        """Returns the number of blocks since uid last set weights, None if unknown."""
+        last_update = self.last_update
+        if uid >= len(last_update):
+            return None
+        return self.current_block - last_update[uid]
+
+    def mark_updated(self, uid: int):
+        # Reflect our own weight update until the next poll reads it from chain.
+        if uid < len(self.last_update):
+            self.last_update = list(self.last_update)
+            self.last_update[uid] = self.current_block
+
+    def start(self):
+        # Must be called from the running event loop.
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.poll())
+
+    async def poll(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                bt.logging.warning(f"Failed to refresh block state: {e}")
+            await asyncio.sleep(self.interval)
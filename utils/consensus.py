@@ -0,0 +1,184 @@
+import json
+import hashlib
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+from utils.jsonrpc import parse_block_number
+from utils.rpc_cache import BLOCK_PARAM_METHODS, INCLUDED_METHODS, RANGE_METHODS
+
+# Lookups answered with an object carrying its block number, or null until a node
+# has seen it. Only compared when every answer is in a final block.
+LOOKUP_METHODS = INCLUDED_METHODS | {
+    "eth_getBlockByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+}
+
+# Methods with a single correct answer, others are never compared: tip state,
+# node-local filters or client details legitimately differ between honest miners.
+VOTED_METHODS = (
+    set(BLOCK_PARAM_METHODS)
+    | RANGE_METHODS
+    | LOOKUP_METHODS
+    | {"eth_chainId", "net_version"}
+)
+
+
+def is_final_tag(tag, final_block: Optional[int]) -> bool:
+    # Tags naming a moving block, like "latest" or "safe", are never final.
+    if isinstance(tag, dict):
+        # EIP-1898 block identifiers.
+        if "blockHash" in tag:
+            return True
+        tag = tag.get("blockNumber")
+    if tag == "earliest":
+        return True
+    block = parse_block_number(tag)
+    return block is not None and final_block is not None and block <= final_block
+
+
+def is_volatile_call(call, final_block: Optional[int]) -> bool:
+    if not isinstance(call, dict):
+        return True
+    method = call.get("method")
+    if method not in VOTED_METHODS:
+        return True
+    params = call.get("params") or []
+    if not isinstance(params, list):
+        return True
+    if method in BLOCK_PARAM_METHODS:
+        position = BLOCK_PARAM_METHODS[method]
+        # A missing block argument means "latest".
+        tag = params[position] if len(params) > position else None
+        return not is_final_tag(tag, final_block)
+    if method in RANGE_METHODS:
+        if not params or not isinstance(params[0], dict):
+            return True
+        if "blockHash" in params[0]:
+            return False
+        return not all(
+            is_final_tag(params[0].get(key), final_block)
+            for key in ("fromBlock", "toBlock")
+        )
+    return False
+
+
+def is_volatile(payload: str, final_block: Optional[int] = None) -> bool:
+    """Check if any call in the payload has no single correct answer to vote on.
+    Args:
+        payload (str): JSON-RPC request or batch.
+        final_block (int): Highest finalized block of the chain, None if unknown.
+    Returns:
+        bool: True if the responses should not be compared.
+    """
+    try:
+        calls = json.loads(payload)
+    except (TypeError, ValueError):
+        return True
+    if not isinstance(calls, list):
+        calls = [calls]
+    return any(is_volatile_call(call, final_block) for call in calls)
+
+
+def lookup_ids(payload: str) -> Set[str]:
+    """Returns the ids of the lookup calls in the payload, see LOOKUP_METHODS.
+    Args:
+        payload (str): JSON-RPC request or batch.
+    Returns:
+        ids (Set[str]): JSON encoded ids of the calls whose answers must be final.
+    """
+    try:
+        calls = json.loads(payload)
+    except (TypeError, ValueError):
+        return set()
+    if not isinstance(calls, list):
+        calls = [calls]
+    return {
+        json.dumps(call.get("id"))
+        for call in calls
+        if isinstance(call, dict) and call.get("method") in LOOKUP_METHODS
+    }
+
+
+def is_settled(body, lookups: Set[str], final_block: Optional[int]) -> bool:
+    # Lookup answers are only compared once found in a final block by this miner.
+    members = body if isinstance(body, list) else [body]
+    for member in members:
+        if not isinstance(member, dict) or json.dumps(member.get("id")) not in lookups:
+            continue
+        result = member.get("result")
+        if not isinstance(result, dict):
+            return False
+        block = parse_block_number(result.get("blockNumber", result.get("number")))
+        if block is None or final_block is None or block > final_block:
+            return False
+    return True
+
+
+def head_of(response: str) -> Optional[int]:
+    # Block number answered to eth_blockNumber, None for errors.
+    try:
+        body = json.loads(response)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(body, dict):
+        return None
+    return parse_block_number(body.get("result"))
+
+
+def strip(body):
+    # Only the outcome of a call is compared, not its envelope.
+    if isinstance(body, dict):
+        return {
+            key: value for key, value in body.items() if key not in ("id", "jsonrpc")
+        }
+    return body
+
+
+def body_digest(body) -> bytes:
+    if isinstance(body, list):
+        # Batch members may come back in any order.
+        members = sorted(
+            (member for member in body if isinstance(member, dict)),
+            key=lambda member: json.dumps(member.get("id")),
+        )
+        body = [strip(member) for member in members]
+    else:
+        body = strip(body)
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+def response_digest(
+    response: str, lookups: Set[str] = frozenset(), final_block: Optional[int] = None
+) -> Tuple[Optional[bytes], bool]:
+    """Returns a short hash of the JSON-RPC outcome, ignoring ids and formatting.
+    Args:
+        response (str): JSON-RPC response or batch response body.
+        lookups (Set[str]): Ids of the lookup calls, see `lookup_ids`.
+        final_block (int): Highest finalized block of the chain, None if unknown.
+    Returns:
+        digest (bytes): 16 byte digest, None if the body is not JSON.
+        settled (bool): False if a lookup answer is not in a final block yet.
+    """
+    try:
+        body = json.loads(response)
+    except (TypeError, ValueError):
+        return None, True
+    if lookups and not is_settled(body, lookups, final_block):
+        return None, False
+    return body_digest(body), True
+
+
+def vote(digests: List[bytes], quorum: int = 2) -> Optional[bytes]:
+    """Returns the digest agreed on by a strict majority of at least quorum responses.
+    Args:
+        digests (List[bytes]): Digests of the responses to one request.
+        quorum (int): Minimum number of agreeing responses.
+    Returns:
+        digest (bytes): The consensus digest, None if there is no consensus.
+    """
+    if not digests:
+        return None
+    digest, count = Counter(digests).most_common(1)[0]
+    if count >= quorum and count * 2 > len(digests):
+        return digest
+    return None
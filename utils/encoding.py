@@ -0,0 +1,64 @@
+import zlib
+import base64
+from typing import Iterable, Optional
+
+
+def gzip_compress(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_decompress(data: bytes) -> bytes:
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+# Supported response encodings, in order of preference.
+ENCODINGS = {
+    "deflate": (zlib.compress, zlib.decompress),
+    "gzip": (gzip_compress, gzip_decompress),
+}
+
+
+def negotiate(accepted: Iterable[str]) -> Optional[str]:
+    """Picks the encoding to answer with.
+    Args:
+        accepted (Iterable[str]): Encodings the requester can decode.
+    Returns:
+        encoding (str): Preferred supported encoding, None if there is none.
+    """
+    accepted = set(accepted or ())
+    return next((encoding for encoding in ENCODINGS if encoding in accepted), None)
+
+
+def encode(body: str, encoding: str, level: int = 1) -> str:
+    """Compresses a response body into base64 text so it still fits a str field.
+    Args:
+        body (str): Response body.
+        encoding (str): One of ENCODINGS.
+        level (int): Compression level, low levels favour speed.
+    Returns:
+        encoded (str): Base64 of the compressed body.
+    """
+    compress, _ = ENCODINGS[encoding]
+    return base64.b64encode(compress(body.encode(), level)).decode("ascii")
+
+
+def decode(encoded: str, encoding: Optional[str]) -> str:
+    """Reverses encode, bodies without an encoding are returned as they are.
+    Args:
+        encoded (str): Response body as sent.
+        encoding (str): Encoding of the body, None if it is not encoded.
+    Returns:
+        body (str): Plain response body.
+    Raises:
+        ValueError: If the encoding is unknown or the body is corrupt.
+    """
+    if encoding is None:
+        return encoded
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported response encoding: {encoding}")
+    _, decompress = ENCODINGS[encoding]
+    try:
+        return decompress(base64.b64decode(encoded)).decode()
+    except (zlib.error, ValueError) as e:
+        raise ValueError(f"Invalid {encoding} response: {e}")
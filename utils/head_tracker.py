@@ -0,0 +1,169 @@
+import time
+import json
+import asyncio
+import bittensor as bt
+from typing import Callable, Dict, Optional
+from protocol import Chains, BLOCK_TIMES
+from utils.jsonrpc import dumps, parse_block_number, result_response
+
+# One round-trip per poll: the latest block carries the head, plus the gas price.
+POLL_PAYLOAD = dumps(
+    [
+        {
+            "jsonrpc": "2.0",
+            "id": 0,
+            "method": "eth_getBlockByNumber",
+            "params": ["latest", False],
+        },
+        {"jsonrpc": "2.0", "id": 1, "method": "eth_gasPrice", "params": []},
+    ]
+)
+
+# Asked once, they never change.
+IDENTITY_PAYLOAD = dumps(
+    [
+        {"jsonrpc": "2.0", "id": 0, "method": "eth_chainId", "params": []},
+        {"jsonrpc": "2.0", "id": 1, "method": "net_version", "params": []},
+    ]
+)
+
+# Methods answered from the tip state.
+TIP_METHODS = {"eth_blockNumber", "eth_gasPrice", "eth_getBlockByNumber"}
+
+
+class ChainHead:
+    """Latest known tip state of one chain, with its results already serialized."""
+
+    def __init__(self):
+        self.number = None
+        self.updated = 0.0
+        self.demanded = 0.0
+        self.results: Dict[str, str] = {}
+
+
+class HeadTracker:
+    """Polls the head of chains receiving tip-state calls and answers them from memory.
+
+    A chain is polled once per block time, at most once per `min_interval`, from its
+    first tip-state call until none has come for `idle_timeout` seconds. Tip results
+    are only served while the last successful poll is at most `max_lag_blocks` poll
+    intervals old, otherwise the call goes upstream.
+    """
+
+    def __init__(
+        self,
+        post: Callable,
+        chains,
+        max_lag_blocks: float = 2.0,
+        head_listener: Optional[Callable[[Chains, int], None]] = None,
+        min_interval: float = 1.0,
+        idle_timeout: float = 60.0,
+    ):
+        self.post = post
+        self.chains = list(chains)
+        self.max_lag_blocks = max_lag_blocks
+        self.min_interval = min_interval
+        self.idle_timeout = idle_timeout
+        self.head_listener = head_listener
+        self.heads: Dict[Chains, ChainHead] = {chain: ChainHead() for chain in chains}
+        self.tasks: Dict[Chains, asyncio.Task] = {}
+        self.answered = 0
+
+    def key(self, call: dict) -> Optional[str]:
+        # Only the parameter shapes with a single current answer are served.
+        method = call["method"]
+        params = call.get("params") or []
+        if method in ("eth_chainId", "net_version"):
+            return method
+        if method in ("eth_blockNumber", "eth_gasPrice"):
+            return method if not params else None
+        if method == "eth_getBlockByNumber":
+            if len(params) in (1, 2) and params[0] == "latest":
+                if len(params) == 1 or params[1] is False:
+                    return method
+        return None
+
+    def answer(self, chain: Chains, call: dict) -> Optional[str]:
+        """Returns the response to a tip-state call, None if it must go upstream.
+        Args:
+            chain (Chains): Chain the call is made on.
+            call (dict): Decoded JSON-RPC call.
+        Returns:
+            response (str): JSON-RPC response body.
+        """
+        head = self.heads.get(chain)
+        if head is None:
+            return None
+        key = self.key(call)
+        if key is None:
+            return None
+        result = head.results.get(key)
+        if key in TIP_METHODS:
+            now = time.monotonic()
+            head.demanded = now
+            self.wake(chain)
+            if now - head.updated > self.max_lag_blocks * self.interval(chain):
+                return None
+        if result is None:
+            return None
+        self.answered += 1
+        return result_response(call.get("id"), result)
+
+    async def query(self, chain: Chains, payload: str) -> Dict[int, object]:
+        status, body = await self.post(chain, payload)
+        if status != 200:
+            raise ValueError(f"status {status}")
+        results = json.loads(body)
+        if not isinstance(results, list):
+            raise ValueError(f"unexpected response {body[:200]}")
+        return {
+            result.get("id"): result.get("result")
+            for result in results
+            if isinstance(result, dict) and "error" not in result
+        }
+
+    async def refresh(self, chain: Chains):
+        head = self.heads[chain]
+        if "eth_chainId" not in head.results:
+            results = await self.query(chain, IDENTITY_PAYLOAD)
+            for i, method in enumerate(("eth_chainId", "net_version")):
+                if results.get(i) is not None:
+                    head.results[method] = dumps(results[i])
+
+        results = await self.query(chain, POLL_PAYLOAD)
+        block = results.get(0)
+        if not isinstance(block, dict):
+            raise ValueError("missing latest block")
+        number = parse_block_number(block.get("number"))
+        if number is None:
+            raise ValueError("missing block number")
+        if head.number is not None and number < head.number:
+            # A lagging upstream answered, keep the newer head.
+            return
+        head.results["eth_blockNumber"] = dumps(block["number"])
+        head.results["eth_getBlockByNumber"] = dumps(block)
+        if results.get(1) is not None:
+            head.results["eth_gasPrice"] = dumps(results[1])
+        head.number = number
+        head.updated = time.monotonic()
+        if self.head_listener is not None:
+            self.head_listener(chain, number)
+
+    def interval(self, chain: Chains) -> float:
+        return max(BLOCK_TIMES[chain], self.min_interval)
+
+    def wake(self, chain: Chains):
+        # Must be called from the event loop serving requests.
+        task = self.tasks.get(chain)
+        if task is None or task.done():
+            self.tasks[chain] = asyncio.create_task(self.poll(chain))
+
+    async def poll(self, chain: Chains):
+        # Stops once the chain gets no tip-state calls, the next one restarts it.
+        head = self.heads[chain]
+        while time.monotonic() - head.demanded < self.idle_timeout:
+            try:
+                await self.refresh(chain)
+            except Exception as e:
+                bt.logging.debug(f"Failed to refresh {chain.value} head: {e}")
+            await asyncio.sleep(self.interval(chain))
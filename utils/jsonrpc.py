@@ -0,0 +1,111 @@
+import json
+from typing import Any, List, Optional
+
+
+def parse_call(payload: str) -> Optional[dict]:
+    """Parses a single JSON-RPC call.
+    Args:
+        payload (str): JSON-RPC request body.
+    Returns:
+        call (dict): The decoded call, None for batches or malformed payloads.
+    """
+    try:
+        call = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(call, dict) or not isinstance(call.get("method"), str):
+        return None
+    return call
+
+
+def parse_batch(payload: str) -> Optional[List[dict]]:
+    """Parses a JSON-RPC batch.
+    Args:
+        payload (str): JSON-RPC request body.
+    Returns:
+        calls (List[dict]): The decoded calls, None for single calls, empty or malformed batches.
+    """
+    try:
+        calls = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(calls, list) or not calls:
+        return None
+    if not all(
+        isinstance(call, dict) and isinstance(call.get("method"), str)
+        for call in calls
+    ):
+        return None
+    return calls
+
+
+def error_response(request_id: Any, message: str, code: int = -32603) -> str:
+    return dumps(
+        {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {"code": code, "message": message},
+        }
+    )
+
+
+def canonical(value: Any) -> Any:
+    # Hex quantities and data are case-insensitive.
+    if isinstance(value, str):
+        return value.lower() if value.startswith("0x") else value
+    if isinstance(value, list):
+        return [canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {key: canonical(item) for key, item in value.items()}
+    return value
+
+
+def call_key(chain: str, call: dict) -> str:
+    """Returns a key identifying the call regardless of its id and formatting.
+    Args:
+        chain (str): Chain the call is made on.
+        call (dict): Decoded JSON-RPC call.
+    Returns:
+        key (str): Chain, method and canonicalized params.
+    """
+    params = json.dumps(
+        canonical(call.get("params", [])), sort_keys=True, separators=(",", ":")
+    )
+    return f"{chain}|{call['method']}|{params}"
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def result_response(request_id: Any, result: str) -> str:
+    """Builds a JSON-RPC response around an already serialized result.
+    Args:
+        request_id (Any): Id of the call being answered.
+        result (str): JSON serialized result.
+    Returns:
+        response (str): JSON-RPC response body.
+    """
+    return f'{{"jsonrpc":"2.0","id":{dumps(request_id)},"result":{result}}}'
+
+
+def with_id(response: str, request_id: Any) -> str:
+    """Returns the JSON-RPC response rewritten to answer the call with request_id."""
+    try:
+        body = json.loads(response)
+    except (TypeError, ValueError):
+        return response
+    if not isinstance(body, dict) or body.get("id") == request_id:
+        return response
+    body["id"] = request_id
+    return dumps(body)
+
+
+def parse_block_number(value: Any) -> Optional[int]:
+    """Returns the block number of a hex quantity, None for tags and invalid values."""
+    if isinstance(value, str) and value.startswith("0x"):
+        try:
+            return int(value, 16)
+        except ValueError:
+            return None
+    return None
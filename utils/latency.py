@@ -0,0 +1,47 @@
+from typing import Optional
+
+
+class LatencyWindow:
+    """Rolling window over the most recent latency samples.
+
+    Percentiles are computed from a sorted snapshot of the window that is only
+    refreshed after `refresh` new samples, so reading them on every request stays cheap.
+    """
+
+    def __init__(self, size: int = 1000, refresh: int = 32):
+        self.size = size
+        self.refresh = refresh
+        self.samples = [0.0] * size
+        self.count = 0
+        self.index = 0
+        self.sorted_samples = []
+        self.stale = 0
+
+    def add(self, value: float):
+        """Add a latency sample in seconds.
+        Args:
+            value (float): Observed latency.
+        """
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.stale += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def percentile(self, q: float, default: Optional[float] = None) -> Optional[float]:
+        """Returns the q-th percentile of the window.
+        Args:
+            q (float): Percentile in the range [0, 100].
+            default (float): Value returned while the window is empty.
+        Returns:
+            latency (float): Nearest-rank percentile of the recorded samples.
+        """
+        if self.count == 0:
+            return default
+        if self.stale >= self.refresh or len(self.sorted_samples) != self.count:
+            self.sorted_samples = sorted(self.samples[: self.count])
+            self.stale = 0
+        rank = int(round(q / 100 * (self.count - 1)))
+        return self.sorted_samples[min(max(rank, 0), self.count - 1)]
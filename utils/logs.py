@@ -0,0 +1,193 @@
+import json
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from protocol import Chains
+from utils.jsonrpc import dumps, parse_block_number, result_response
+from utils.rpc_cache import ResponseCache
+
+# Error messages of providers capping the results or the span of eth_getLogs.
+TOO_MANY_RESULTS_MARKERS = (
+    "more than",
+    "too many",
+    "limit exceeded",
+    "response size",
+    "range is too large",
+    "block range",
+    "exceed maximum block range",
+)
+
+
+def is_too_many_results(error) -> bool:
+    """Check if a JSON-RPC error asks for a smaller eth_getLogs range."""
+    if not isinstance(error, dict):
+        return False
+    if error.get("code") == -32005:
+        return True
+    message = str(error.get("message", "")).lower()
+    return any(marker in message for marker in TOO_MANY_RESULTS_MARKERS)
+
+
+def resolve_range(log_filter: dict) -> Optional[Tuple[int, int]]:
+    """Returns the block range of an eth_getLogs filter.
+
+    Moving tags such as "latest", and a missing bound, leave the range unresolved:
+    the miner's view of the head can be blocks behind the upstream's, and splitting
+    at it would silently drop the newest logs.
+    Args:
+        log_filter (dict): Filter object of the call.
+    Returns:
+        range (Tuple[int, int]): First and last block, None if it cannot be resolved.
+    """
+    if "blockHash" in log_filter:
+        return None
+    bounds = []
+    for key in ("fromBlock", "toBlock"):
+        tag = log_filter.get(key, "latest")
+        if tag == "earliest":
+            bounds.append(0)
+        else:
+            block = parse_block_number(tag)
+            if block is None:
+                return None
+            bounds.append(block)
+    return bounds[0], bounds[1]
+
+
+def split_range(start: int, end: int, span: int) -> List[Tuple[int, int]]:
+    """Splits a block range into parts aligned on multiples of span.
+
+    Aligned parts of overlapping queries share the same bounds, so their finalized
+    results can be reused from the cache.
+    """
+    parts = []
+    while start <= end:
+        part_end = min(end, (start // span + 1) * span - 1)
+        parts.append((start, part_end))
+        start = part_end + 1
+    return parts
+
+
+async def gather_or_cancel(*aws) -> list:
+    # Unlike asyncio.gather, the other calls are cancelled as soon as one fails.
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class RPCError(Exception):
+    """JSON-RPC error answered by the upstream for one part of a split call."""
+
+    def __init__(self, error: dict):
+        super().__init__(error.get("message"))
+        self.error = error
+
+
+class LogsSplitter:
+    """Serves wide eth_getLogs ranges as concurrent bounded sub-range queries.
+
+    Parts are spread over the chain's upstreams, at most `concurrency` at a time per
+    call, and bisected whenever a provider reports too many results. Logs are merged
+    back in block order. Calls needing more than `max_parts` parts are not split, so
+    one call cannot take over a chain's upstream capacity.
+    """
+
+    def __init__(
+        self,
+        post: Callable[..., Awaitable[Tuple[int, str]]],
+        cache: ResponseCache,
+        max_span: int = 2000,
+        concurrency: int = 8,
+        max_parts: int = 64,
+    ):
+        self.post = post
+        self.cache = cache
+        self.max_span = max_span
+        self.concurrency = concurrency
+        self.max_parts = max_parts
+        self.split = 0
+
+    def parts(self, chain: Chains, call: dict) -> Optional[List[Tuple[int, int]]]:
+        # Returns the sub-ranges of a call worth splitting, None otherwise.
+        params = call.get("params") or []
+        if len(params) != 1 or not isinstance(params[0], dict):
+            return None
+        bounds = resolve_range(params[0])
+        if bounds is None:
+            return None
+        start, end = bounds
+        if end - start + 1 <= self.max_span:
+            return None
+        if end - start + 1 > self.max_span * self.max_parts:
+            # Left to the upstream, which answers or rejects it in one call.
+            return None
+        return split_range(start, end, self.max_span)
+
+    async def fetch(
+        self,
+        chain: Chains,
+        call: dict,
+        parts: List[Tuple[int, int]],
+        priority: float = 0.0,
+    ) -> str:
+        """Fetches the parts of an eth_getLogs call and merges them in one response.
+        Args:
+            chain (Chains): Chain the call is made on.
+            call (dict): Decoded eth_getLogs call.
+            parts (List[Tuple[int, int]]): Block ranges covering the call, see `parts`.
+            priority (float): Admission priority of the caller.
+        Returns:
+            response (str): JSON-RPC response to the call.
+        """
+        self.split += 1
+        log_filter = call["params"][0]
+        budget = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_part(index: int, start: int, end: int) -> list:
+            part = {
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": "eth_getLogs",
+                "params": [dict(log_filter, fromBlock=hex(start), toBlock=hex(end))],
+            }
+            cached = self.cache.get(chain, part)
+            if cached is not None:
+                return json.loads(cached)["result"]
+            async with budget:
+                status, body = await self.post(
+                    chain, dumps(part), "eth_getLogs", True, priority, index
+                )
+            if status != 200:
+                raise ValueError(f"Upstream request failed with status {status}")
+            response = json.loads(body)
+            error = response.get("error") if isinstance(response, dict) else None
+            if error is not None:
+                if start < end and is_too_many_results(error):
+                    # Bisect until the provider accepts the range.
+                    middle = (start + end) // 2
+                    halves = await gather_or_cancel(
+                        fetch_part(index, start, middle),
+                        fetch_part(index + 1, middle + 1, end),
+                    )
+                    logs = halves[0] + halves[1]
+                    # The whole part is reused next time, without the failed attempt.
+                    self.cache.store(chain, part, {"result": logs})
+                    return logs
+                raise RPCError(error)
+            if not isinstance(response, dict) or not isinstance(
+                response.get("result"), list
+            ):
+                raise ValueError(f"Invalid eth_getLogs response: {body[:200]}")
+            self.cache.store(chain, part, response)
+            return response["result"]
+
+        try:
+            results = await gather_or_cancel(
+                *(fetch_part(i, start, end) for i, (start, end) in enumerate(parts))
+            )
+        except RPCError as e:
+            return dumps({"jsonrpc": "2.0", "id": call.get("id"), "error": e.error})
+        logs = [log for part in results for log in part]
+        return result_response(call.get("id"), dumps(logs))
@@ -0,0 +1,274 @@
+import time
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(
+    names: Tuple[str, ...], values: Tuple[str, ...], extra: str = ""
+) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base of the metric families, one child per combination of label values.
+
+    Children are created once and cached, so recording is a dict lookup plus an
+    arithmetic update. Hot paths can keep a reference to a child to skip the lookup.
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.label_names:
+            self.children[()] = self.new_child()
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        return "\n".join(lines + self.samples())
+
+
+class CounterChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        # Expose a total that is already counted elsewhere.
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.children[()].set_function(function)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{format_labels(self.label_names, values)} {child.get()}"
+            for values, child in list(self.children.items())
+        ]
+
+
+class GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        # Read the value at scrape time instead of on every change.
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def new_child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self.children[()].set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.children[()].dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.children[()].set_function(function)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, values)} {child.get()}"
+            for values, child in list(self.children.items())
+        ]
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def time(self) -> "Timer":
+        return Timer(self.children[()])
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = format_labels(self.label_names, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Timer:
+    """Context manager observing the elapsed seconds into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: HistogramChild):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Modules may be imported more than once, keep the first registration.
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(
+    port: int, registry: Registry = REGISTRY
+) -> Optional[ThreadingHTTPServer]:
+    """Serves the registry on http://0.0.0.0:port/metrics from a daemon thread.
+    Args:
+        port (int): Port to listen on, 0 disables the endpoint.
+        registry (Registry): Metrics to expose.
+    Returns:
+        server (ThreadingHTTPServer): The running server, None if disabled.
+    """
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,147 @@
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import random
+import threading
+import bittensor as bt
+from typing import Iterator, List, Optional
+
+
+class TrafficRecorder:
+    """Appends sampled entrypoint requests and their outcome to rotating gzip logs.
+
+    The request path only samples and enqueues a tuple, a writer thread serializes
+    and compresses. When the queue is full records are dropped rather than slowing
+    requests down. Files rotate at `max_bytes` of input and only the newest
+    `max_files` are kept.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 1.0,
+        max_bytes: int = 100 * 1024 * 1024,
+        max_files: int = 10,
+        queue_size: int = 10000,
+    ):
+        self.directory = os.path.expanduser(directory)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self.thread = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def record(
+        self,
+        timestamp: float,
+        chain_id: str,
+        payload: str,
+        latency: float,
+        error: Optional[str] = None,
+    ):
+        """Queues a served request for the log, if it is sampled.
+        Args:
+            timestamp (float): Time the request was received.
+            chain_id (str): Chain of the request.
+            payload (str): JSON-RPC payload.
+            latency (float): Seconds until the reply was sent.
+            error (str): Error replied, None on success.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        try:
+            self.queue.put_nowait((timestamp, chain_id, payload, latency, error))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_loop, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def open_file(self):
+        path = os.path.join(self.directory, f"traffic-{time.time():.6f}.jsonl.gz")
+        files = sorted(glob.glob(os.path.join(self.directory, "traffic-*.jsonl.gz")))
+        for old in files[: max(len(files) - self.max_files + 1, 0)]:
+            os.remove(old)
+        return gzip.open(path, "wt", compresslevel=1)
+
+    def write_loop(self):
+        f = None
+        written = 0
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=1)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    return
+                if item:
+                    if f is None or written >= self.max_bytes:
+                        if f is not None:
+                            f.close()
+                        f = self.open_file()
+                        written = 0
+                    timestamp, chain_id, payload, latency, error = item
+                    line = json.dumps(
+                        {
+                            "t": round(timestamp, 6),
+                            "chain_id": chain_id,
+                            "payload": payload,
+                            "latency": round(latency, 6),
+                            "error": error,
+                        },
+                        separators=(",", ":"),
+                    )
+                    f.write(line + "\n")
+                    written += len(line) + 1
+                    self.recorded += 1
+                if f is not None and time.monotonic() - last_flush >= 1:
+                    # Make what was written so far readable even after a crash.
+                    f.flush()
+                    last_flush = time.monotonic()
+        except Exception as e:
+            bt.logging.error(f"Traffic recorder stopped: {e}")
+        finally:
+            if f is not None:
+                f.close()
+
+
+def read_recording(paths: List[str]) -> Iterator[dict]:
+    """Yields the records of recording files or directories, oldest file first.
+    Args:
+        paths (List[str]): Files written by TrafficRecorder, or directories of them.
+    Returns:
+        records (Iterator[dict]): Decoded records, a truncated tail is skipped.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "traffic-*.jsonl.gz"))))
+        else:
+            files.append(path)
+    for path in files:
+        try:
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break
+        except (EOFError, OSError):
+            # A recorder that crashed leaves an unterminated stream.
+            continue
@@ -0,0 +1,204 @@
+import time
+import json
+from enum import Enum
+from collections import OrderedDict
+from typing import Dict, Optional
+from protocol import Chains, BLOCK_TIMES, FINALITY_DEPTHS
+from utils.jsonrpc import call_key, dumps, parse_block_number, result_response
+
+
+class CachePolicy(Enum):
+    FOREVER = "forever"
+    BLOCK = "block"
+    NEVER = "never"
+
+
+# Results that never change once they exist.
+IMMUTABLE_METHODS = {
+    "eth_chainId",
+    "net_version",
+    "eth_getBlockByHash",
+    "eth_getBlockTransactionCountByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+    "eth_getUncleByBlockHashAndIndex",
+    "eth_getUncleCountByBlockHash",
+}
+
+# Results that describe the chain tip.
+HEAD_METHODS = {
+    "eth_blockNumber",
+    "eth_gasPrice",
+    "eth_maxPriorityFeePerGas",
+    "eth_blobBaseFee",
+}
+
+# Position of the block parameter for methods evaluated at a given block.
+BLOCK_PARAM_METHODS = {
+    "eth_call": 1,
+    "eth_estimateGas": 1,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+    "eth_getProof": 2,
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "eth_getTransactionByBlockNumberAndIndex": 0,
+    "eth_getBlockReceipts": 0,
+}
+
+# Methods filtering over a block range.
+RANGE_METHODS = {"eth_getLogs"}
+
+# Methods whose result carries the block it was included in.
+INCLUDED_METHODS = {
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+}
+
+
+class ResponseCache:
+    """Memory bounded LRU cache of JSON-RPC results with per-method policies.
+
+    Results are cached forever when they cannot change, until the next block when
+    they describe the chain tip, and never otherwise. Chain heads are learned from
+    responses passing through the cache or reported with `observe_head`.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.heads: Dict[Chains, int] = {}
+
+    def observe_head(self, chain: Chains, block: int):
+        if block > self.heads.get(chain, -1):
+            self.heads[chain] = block
+
+    def is_final(self, chain: Chains, block: Optional[int]) -> bool:
+        head = self.heads.get(chain)
+        if block is None or head is None:
+            return False
+        return block <= head - FINALITY_DEPTHS[chain]
+
+    def policy(self, chain: Chains, call: dict, result) -> CachePolicy:
+        method = call["method"]
+        params = call.get("params") or []
+        if method in IMMUTABLE_METHODS:
+            return CachePolicy.FOREVER if result is not None else CachePolicy.NEVER
+        if method in HEAD_METHODS:
+            return CachePolicy.BLOCK
+        if method in INCLUDED_METHODS:
+            if not isinstance(result, dict) or result.get("blockNumber") is None:
+                # Unknown or pending transactions can still change.
+                return CachePolicy.NEVER
+            block = parse_block_number(result["blockNumber"])
+            if self.is_final(chain, block):
+                return CachePolicy.FOREVER
+            return CachePolicy.BLOCK
+        if method in RANGE_METHODS:
+            if result is None or not params or not isinstance(params[0], dict):
+                return CachePolicy.NEVER
+            if "blockHash" in params[0]:
+                return CachePolicy.FOREVER
+            # Logs of a range ending in a finalized block no longer change.
+            block = parse_block_number(params[0].get("toBlock"))
+            if self.is_final(chain, block):
+                return CachePolicy.FOREVER
+            return CachePolicy.NEVER
+        if method in BLOCK_PARAM_METHODS:
+            if result is None:
+                return CachePolicy.NEVER
+            position = BLOCK_PARAM_METHODS[method]
+            tag = params[position] if len(params) > position else "latest"
+            if isinstance(tag, dict):
+                # EIP-1898 block identifiers.
+                if "blockHash" in tag:
+                    return CachePolicy.FOREVER
+                tag = tag.get("blockNumber", "latest")
+            if tag == "earliest":
+                return CachePolicy.FOREVER
+            if tag == "pending":
+                return CachePolicy.NEVER
+            block = parse_block_number(tag)
+            if self.is_final(chain, block):
+                return CachePolicy.FOREVER
+            return CachePolicy.BLOCK
+        return CachePolicy.NEVER
+
+    def get(self, chain: Chains, call: dict) -> Optional[str]:
+        """Returns the cached response for call with its id, None on a miss.
+        Args:
+            chain (Chains): Chain the call is made on.
+            call (dict): Decoded JSON-RPC call.
+        Returns:
+            response (str): JSON-RPC response body.
+        """
+        key = call_key(chain.value, call)
+        entry = self.entries.get(key)
+        if entry is not None:
+            result, expires, head = entry
+            if (expires is None or expires > time.monotonic()) and (
+                head is None or head == self.heads.get(chain)
+            ):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result_response(call.get("id"), result)
+            self.evict(key)
+        self.misses += 1
+        return None
+
+    def put(self, chain: Chains, call: dict, response: str):
+        """Stores a successful upstream response according to the method policy.
+        Args:
+            chain (Chains): Chain the call was made on.
+            call (dict): Decoded JSON-RPC call.
+            response (str): JSON-RPC response body.
+        """
+        try:
+            body = json.loads(response)
+        except (TypeError, ValueError):
+            return
+        self.store(chain, call, body)
+
+    def store(self, chain: Chains, call: dict, body):
+        """Stores an already decoded JSON-RPC response, see `put`."""
+        if not isinstance(body, dict) or "error" in body or "result" not in body:
+            return
+        result = body["result"]
+        if call["method"] == "eth_blockNumber":
+            block = parse_block_number(result)
+            if block is not None:
+                self.observe_head(chain, block)
+
+        policy = self.policy(chain, call, result)
+        if policy == CachePolicy.NEVER:
+            return
+        expires, head = None, None
+        if policy == CachePolicy.BLOCK:
+            # Expire on the next known head, or after one block time if heads are unknown.
+            expires = time.monotonic() + BLOCK_TIMES[chain]
+            head = self.heads.get(chain)
+
+        key = call_key(chain.value, call)
+        result = dumps(result)
+        if key in self.entries:
+            self.evict(key)
+        self.entries[key] = (result, expires, head)
+        self.size += len(key) + len(result)
+        while self.size > self.max_bytes and self.entries:
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key: str):
+        result, _, _ = self.entries.pop(key)
+        self.size -= len(key) + len(result)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0
+        return (
+            f"Cache: {len(self.entries)} entries, {self.size / 1e6:.1f} MB, "
+            f"{self.hits} hits, {self.misses} misses ({ratio:.1%} hit rate)"
+        )
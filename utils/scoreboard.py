@@ -0,0 +1,235 @@
+import os
+import numpy as np
+from typing import List, Optional
+from protocol import Chains
+
+# Column of each chain in the per-chain statistics.
+CHAIN_INDEX = {chain.value: i for i, chain in enumerate(Chains)}
+
+
+def chain_index(chain_id: str) -> Optional[int]:
+    return CHAIN_INDEX.get(chain_id)
+
+
+class Scoreboard:
+    """Per-uid miner statistics held in NumPy arrays.
+
+    Requests only touch the rows of the miners they queried. The moving average
+    score of every uid is advanced in one vectorized `step`, once per block.
+    Routing statistics are also kept per chain, one column per `Chains` member.
+    """
+
+    def __init__(self, n: int, alpha: float = 0.1, default_latency: float = 1.0):
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self.n = 0
+        self.requests = np.zeros(0, dtype=np.int64)
+        self.responses = np.zeros(0, dtype=np.int64)
+        self.last_request_time = np.zeros(0, dtype=np.float64)
+        # Outcomes of the response consensus checks.
+        self.agreements = np.zeros(0, dtype=np.int64)
+        self.disagreements = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        # Exponentially weighted success rate and latency, used for routing.
+        self.success = np.zeros(0, dtype=np.float64)
+        self.latency = np.zeros(0, dtype=np.float64)
+        # Moving average of the response ratio, used for weights.
+        self.moving_avg_scores = np.zeros(0, dtype=np.float64)
+        # The same routing statistics per (uid, chain).
+        chains = len(CHAIN_INDEX)
+        self.chain_requests = np.zeros((0, chains), dtype=np.int64)
+        self.chain_errors = np.zeros((0, chains), dtype=np.int64)
+        self.chain_success = np.zeros((0, chains), dtype=np.float64)
+        self.chain_latency = np.zeros((0, chains), dtype=np.float64)
+        # Time a miner last reported a chain as unsupported, 0 if it serves it.
+        self.chain_unsupported = np.zeros((0, chains), dtype=np.float64)
+        # Hotkey owning each uid, to detect re-registrations.
+        self.hotkeys: List[str] = []
+        self.resize(n)
+
+    def defaults(self) -> dict:
+        # Initial value of every statistic, new miners start optimistic.
+        return {
+            "requests": 0,
+            "responses": 0,
+            "last_request_time": 0,
+            "agreements": 0,
+            "disagreements": 0,
+            "errors": 0,
+            "success": 1,
+            "latency": self.default_latency,
+            "moving_avg_scores": 1,
+            "chain_requests": 0,
+            "chain_errors": 0,
+            "chain_success": 1,
+            "chain_latency": self.default_latency,
+            "chain_unsupported": 0,
+        }
+
+    def resize(self, n: int):
+        """Grows the arrays to n uids, new uids start with optimistic statistics.
+        Args:
+            n (int): Number of uids in the metagraph.
+        """
+        missing = n - self.n
+        if missing <= 0:
+            return
+
+        for field, fill in self.defaults().items():
+            array = getattr(self, field)
+            setattr(
+                self,
+                field,
+                np.concatenate(
+                    [
+                        array,
+                        np.full((missing,) + array.shape[1:], fill, dtype=array.dtype),
+                    ]
+                ),
+            )
+        self.n = n
+
+    def reset(self, uids: List[int]):
+        for field, fill in self.defaults().items():
+            getattr(self, field)[uids] = fill
+
+    def sync(self, hotkeys: List[str]):
+        """Follows the metagraph, resetting uids whose hotkey changed.
+        Args:
+            hotkeys (List[str]): Hotkey of every uid in the metagraph.
+        """
+        self.resize(len(hotkeys))
+        changed = [
+            uid
+            for uid, hotkey in enumerate(self.hotkeys)
+            if uid < len(hotkeys) and hotkeys[uid] != hotkey
+        ]
+        if changed:
+            self.reset(changed)
+        self.hotkeys = list(hotkeys)
+
+    def snapshot(self) -> np.ndarray:
+        """Returns a copy of every statistic as one record per uid, keyed by hotkey."""
+        fields = [(field, getattr(self, field)) for field in self.defaults()]
+        dtype = [("hotkey", "U64")] + [
+            (field, array.dtype, array.shape[1:]) for field, array in fields
+        ]
+        state = np.zeros(self.n, dtype=dtype)
+        state["hotkey"][: len(self.hotkeys)] = self.hotkeys[: self.n]
+        for field, array in fields:
+            state[field] = array
+        return state
+
+    @staticmethod
+    def write(path: str, state: np.ndarray):
+        # Write to a temporary file first, so a crash never leaves a partial snapshot.
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> int:
+        """Restores the statistics of the current hotkeys from a snapshot.
+        Args:
+            path (str): Snapshot written by `write`.
+        Returns:
+            restored (int): Number of uids restored, uids with a new hotkey keep defaults.
+        """
+        state = np.load(path, mmap_mode="r")
+        rows = {hotkey: row for row, hotkey in enumerate(state["hotkey"]) if hotkey}
+        uids, sources = [], []
+        for uid, hotkey in enumerate(self.hotkeys):
+            if hotkey in rows:
+                uids.append(uid)
+                sources.append(rows[hotkey])
+        for field in self.defaults():
+            if field in state.dtype.names:
+                array = getattr(self, field)
+                if state.dtype[field].shape == array.shape[1:]:
+                    array[uids] = state[field][sources]
+        return len(uids)
+
+    def record(
+        self,
+        uid: int,
+        success: bool,
+        latency: float,
+        now: float,
+        chain: Optional[int] = None,
+    ):
+        """Records the outcome of a single miner query in O(1).
+        Args:
+            uid (int): Queried uid.
+            success (bool): Whether the miner returned a valid response.
+            latency (float): Seconds until the miner answered or timed out.
+            now (float): Time of the request.
+            chain (int): Column of the requested chain, None if unknown.
+        """
+        if uid >= self.n:
+            return
+        self.requests[uid] += 1
+        self.last_request_time[uid] = now
+        if success:
+            self.responses[uid] += 1
+        self.success[uid] += self.alpha * (float(success) - self.success[uid])
+        self.latency[uid] += self.alpha * (latency - self.latency[uid])
+        if chain is None:
+            return
+        self.chain_requests[uid, chain] += 1
+        self.chain_success[uid, chain] += self.alpha * (
+            float(success) - self.chain_success[uid, chain]
+        )
+        self.chain_latency[uid, chain] += self.alpha * (
+            latency - self.chain_latency[uid, chain]
+        )
+        if success:
+            self.chain_unsupported[uid, chain] = 0
+
+    def record_error(self, uid: int, chain: Optional[int] = None):
+        if uid >= self.n:
+            return
+        self.errors[uid] += 1
+        if chain is not None:
+            self.chain_errors[uid, chain] += 1
+
+    def record_unsupported(self, uid: int, chain: int, now: float):
+        # The miner said it does not serve the chain, route around it for a while.
+        if uid < self.n:
+            self.chain_unsupported[uid, chain] = now
+
+    def record_verification(self, uid: int, agreed: bool):
+        """Records whether a response matched the consensus of its request.
+        Args:
+            uid (int): Verified uid.
+            agreed (bool): True if the response matched the majority.
+        """
+        if uid >= self.n:
+            return
+        if agreed:
+            self.agreements[uid] += 1
+        else:
+            self.disagreements[uid] += 1
+            # A wrong answer is no better than no answer for routing.
+            self.success[uid] -= self.alpha * self.success[uid]
+
+    def step(self):
+        # Move every score towards its ratio of correct responses,
+        # untouched uids count as fully responsive.
+        correct = np.maximum(self.responses - self.disagreements, 0)
+        ratio = np.divide(
+            correct,
+            self.requests,
+            out=np.ones(self.n),
+            where=self.requests > 0,
+        )
+        self.moving_avg_scores *= 1 - self.alpha
+        self.moving_avg_scores += self.alpha * ratio
+
+    def weights(self) -> List[float]:
+        """Returns the moving average scores normalized to sum to one."""
+        total = self.moving_avg_scores.sum()
+        if total <= 0:
+            return np.full(self.n, 1 / max(self.n, 1)).tolist()
+        return (self.moving_avg_scores / total).tolist()
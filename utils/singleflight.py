@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Lets identical concurrent calls share one outstanding execution.
+
+    Nothing is stored once the call completes, so callers never see stale results.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.waiters: Dict[str, int] = {}
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Runs fn unless a call with the same key is in flight, then waits on that one.
+        Args:
+            key (str): Identity of the call.
+            fn (Callable): Coroutine function performing the call.
+        Returns:
+            result (Any): Result of the call.
+            shared (bool): True if the result came from another caller's execution.
+        """
+        task = self.calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            # The call runs as its own task, so cancelling any caller, the first
+            # one included, never cancels the work the others are waiting on.
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.done(key, t))
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            # Nobody is left waiting, the call is abandoned.
+            if self.calls.get(key) is task:
+                self.waiters[key] -= 1
+                if not self.waiters[key]:
+                    task.cancel()
+            raise
+
+    def done(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+            del self.waiters[key]
+        # Mark exceptions as retrieved when every caller was cancelled.
+        if not task.cancelled():
+            task.exception()
@@ -1,7 +1,8 @@
-import torch
+import time
 import random
 import bittensor as bt
-from typing import List
+from typing import List, Optional
+from utils.scoreboard import CHAIN_INDEX, Scoreboard
 
 
 def check_uid_availability(
@@ -26,37 +27,183 @@ def check_uid_availability(
     return True
 
 
-def get_random_uids(metagraph: "bt.metagraph.Metagraph", k: int, vpermit_tao_limit: int, exclude: List[int] = None) -> torch.LongTensor:
-    """Returns k available random uids from the metagraph.
-    Args:
-        k (int): Number of uids to return.
-        exclude (List[int]): List of uids to exclude from the random sampling.
-    Returns:
-        uids (torch.LongTensor): Randomly sampled available uids.
-    Notes:
-        If `k` is larger than the number of available `uids`, set `k` to the number of available `uids`.
+class FenwickTree:
+    """Binary indexed tree over non-negative weights supporting O(log n) updates and weighted draws."""
+
+    def __init__(self, weights: List[float]):
+        self.n = len(weights)
+        self.weights = list(weights)
+        self.tree = [0.0] * (self.n + 1)
+        for i, weight in enumerate(self.weights, start=1):
+            self.tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= self.n:
+                self.tree[parent] += self.tree[i]
+
+    def total(self) -> float:
+        total = 0.0
+        i = self.n
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def set(self, index: int, weight: float):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value: float) -> int:
+        """Returns the index whose cumulative weight range contains value."""
+        index = 0
+        bit = 1 << self.n.bit_length()
+        while bit:
+            nxt = index + bit
+            if nxt <= self.n and self.tree[nxt] <= value:
+                index = nxt
+                value -= self.tree[nxt]
+            bit >>= 1
+        # Guard against float drift pointing past the last positive weight.
+        index = min(index, self.n - 1)
+        while index > 0 and self.weights[index] <= 0:
+            index -= 1
+        return index
+
+
+class MinerSelector:
+    """Samples miners weighted by their recent success rate and latency.
+
+    Available uids are indexed once per metagraph sync, so a request only pays for
+    its k weighted draws (O(k log n)) instead of a scan over the whole metagraph.
+    A share of the draws is uniform so new or recovering miners keep being probed.
+    Each chain has its own pool weighted by the miners' statistics on that chain,
+    where miners reporting the chain as unsupported are skipped for `recheck` seconds.
     """
-    candidate_uids = []
-    avail_uids = []
 
-    for uid in range(metagraph.n.item()):
-        uid_is_available = check_uid_availability(
-            metagraph, uid, vpermit_tao_limit
-        )
-        uid_is_not_excluded = exclude is None or uid not in exclude
-
-        if uid_is_available:
-            avail_uids.append(uid)
-            if uid_is_not_excluded:
-                candidate_uids.append(uid)
-    # If k is larger than the number of available uids, set k to the number of available uids.
-    k = min(k, len(avail_uids))
-    # Check if candidate_uids contain enough for querying, if not grab all avaliable uids
-    available_uids = candidate_uids
-    if len(candidate_uids) < k:
-        available_uids += random.sample(
-            [uid for uid in avail_uids if uid not in candidate_uids],
-            k - len(candidate_uids),
+    def __init__(
+        self,
+        scoreboard: "Scoreboard",
+        explore: float = 0.1,
+        min_latency: float = 0.05,
+        recheck: float = 600.0,
+    ):
+        self.scoreboard = scoreboard
+        self.explore = explore
+        self.min_latency = min_latency
+        self.recheck = recheck
+        self.candidates = []
+        self.position = {}
+        self.tree = FenwickTree([])
+        self.chain_trees = [FenwickTree([]) for _ in CHAIN_INDEX]
+
+    def weight(self, uid: int, chain: Optional[int] = None) -> float:
+        board = self.scoreboard
+        if chain is None:
+            return float(board.success[uid] / max(board.latency[uid], self.min_latency))
+        if board.chain_unsupported[uid, chain]:
+            return 0.0
+        return float(
+            board.chain_success[uid, chain]
+            / max(board.chain_latency[uid, chain], self.min_latency)
         )
-    uids = torch.tensor(random.sample(available_uids, k))
-    return uids
+
+    def skipped(self, uid: int, chain: Optional[int], now: float) -> bool:
+        # Recently unsupported miners are not even probed by uniform draws.
+        if chain is None:
+            return False
+        since = self.scoreboard.chain_unsupported[uid, chain]
+        return since > 0 and now - since < self.recheck
+
+    def rebuild(
+        self,
+        metagraph: "bt.metagraph.Metagraph",
+        vpermit_tao_limit: int,
+        exclude: List[int] = None,
+    ):
+        """Rebuilds the availability index, to be called whenever the metagraph syncs.
+        Args:
+            metagraph (:obj: bt.metagraph.Metagraph): Metagraph object
+            vpermit_tao_limit (int): Validator permit tao limit
+            exclude (List[int]): List of uids that are never selected.
+        """
+        n = min(metagraph.n.item(), self.scoreboard.n)
+        exclude = set(exclude or [])
+        self.candidates = [
+            uid
+            for uid in range(n)
+            if uid not in exclude
+            and check_uid_availability(metagraph, uid, vpermit_tao_limit)
+        ]
+        self.position = {uid: i for i, uid in enumerate(self.candidates)}
+        self.tree = FenwickTree([self.weight(uid) for uid in self.candidates])
+        self.chain_trees = [
+            FenwickTree([self.weight(uid, chain) for uid in self.candidates])
+            for chain in range(len(CHAIN_INDEX))
+        ]
+
+    def update(self, uid: int, chain: Optional[int] = None):
+        """Refreshes the sampling weight of uid after its statistics changed.
+        Args:
+            uid (int): Uid recorded in the scoreboard.
+            chain (int): Column of the chain whose statistics changed too.
+        """
+        if uid in self.position:
+            self.tree.set(self.position[uid], self.weight(uid))
+            if chain is not None:
+                self.chain_trees[chain].set(self.position[uid], self.weight(uid, chain))
+
+    def sample(
+        self, k: int, exclude: List[int] = None, chain: Optional[int] = None
+    ) -> List[int]:
+        """Returns up to k distinct available uids, best candidates tending to come first.
+        Args:
+            k (int): Number of uids to return.
+            exclude (List[int]): List of uids to exclude for this request only.
+            chain (int): Column of the requested chain, draws from its pool if given.
+        Returns:
+            uids (List[int]): Sampled uids in draw order.
+        """
+        tree = self.tree if chain is None else self.chain_trees[chain]
+        now = time.time()
+        exclude = set(exclude or [])
+        k = min(k, len(self.candidates) - len(exclude & self.position.keys()))
+        chosen = []
+        # Temporarily zero out excluded and drawn uids to sample without replacement.
+        removed = {}
+        for uid in exclude:
+            if uid in self.position:
+                index = self.position[uid]
+                removed[index] = tree.weights[index]
+                tree.set(index, 0.0)
+        # Bounds the redraws once only skipped miners are left.
+        misses = 0
+        # Set once the weighted total left is only float drift.
+        drained = False
+        try:
+            while len(chosen) < k and misses <= 2 * len(self.candidates):
+                total = tree.total()
+                if drained or random.random() < self.explore or total <= 1e-12:
+                    index = random.randrange(len(self.candidates))
+                    if index in removed:
+                        continue
+                    if self.skipped(self.candidates[index], chain, now):
+                        misses += 1
+                        continue
+                else:
+                    index = tree.find(random.random() * total)
+                    if index in removed:
+                        # Float drift landed on a zeroed entry, only zero weights
+                        # are left, draw uniformly from now on.
+                        drained = True
+                        misses += 1
+                        continue
+                removed[index] = tree.weights[index]
+                tree.set(index, 0.0)
+                chosen.append(self.candidates[index])
+        finally:
+            for index, weight in removed.items():
+                tree.set(index, weight)
+        return chosen
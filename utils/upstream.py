@@ -0,0 +1,316 @@
+import os
+import time
+import asyncio
+import json
+import aiohttp
+import bittensor as bt
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+from protocol import Chains, BLOCK_TIMES
+
+# Methods with side effects are never retried.
+NON_IDEMPOTENT_METHODS = {
+    "eth_sendRawTransaction",
+    "eth_sendTransaction",
+    "eth_submitWork",
+    "eth_submitHashrate",
+}
+
+# Statuses worth retrying on an idempotent request.
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def is_idempotent(payload: str) -> bool:
+    """Check if a JSON-RPC payload can safely be sent more than once.
+    Args:
+        payload (str): JSON-RPC request or batch.
+    Returns:
+        bool: True if no call in the payload has side effects.
+    """
+    try:
+        calls = json.loads(payload)
+    except (TypeError, ValueError):
+        return False
+    if not isinstance(calls, list):
+        calls = [calls]
+    return all(
+        isinstance(call, dict) and call.get("method") not in NON_IDEMPOTENT_METHODS
+        for call in calls
+    )
+
+
+class UpstreamClient:
+    """Async JSON-RPC client keeping a pooled keep-alive session per endpoint.
+
+    Sessions are created lazily so they bind to the event loop serving requests.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+    ):
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, endpoint: str) -> aiohttp.ClientSession:
+        session = self.sessions.get(endpoint)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300
+                ),
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+            )
+            self.sessions[endpoint] = session
+        return session
+
+    async def post(
+        self, endpoint: str, payload: str, idempotent: bool = True
+    ) -> Tuple[int, str]:
+        """Sends a JSON-RPC payload, retrying idempotent calls with exponential backoff.
+        Args:
+            endpoint (str): Upstream URL.
+            payload (str): JSON-RPC request body.
+            idempotent (bool): Whether the payload may be retried.
+        Returns:
+            status (int): HTTP status of the last attempt.
+            body (str): Response body of the last attempt.
+        """
+        attempts = 1 + self.retries if idempotent else 1
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            session = self.session(endpoint)
+            try:
+                async with session.post(endpoint, data=payload) as response:
+                    body = await response.text()
+                    if response.status not in RETRY_STATUSES or last_attempt:
+                        return response.status, body
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+
+class Upstream:
+    """Health, latency and head of a single upstream endpoint."""
+
+    def __init__(self, url: str, alpha: float = 0.2):
+        self.url = url
+        self.alpha = alpha
+        self.latency = None
+        self.head = None
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_success(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.alpha * (latency - self.latency)
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_failure(self):
+        # Back off exponentially, a probe or a last resort request brings it back.
+        self.failures += 1
+        self.down_until = time.monotonic() + min(2 ** (self.failures - 1), 30)
+
+    def available(self, now: float) -> bool:
+        return self.down_until <= now
+
+
+class UpstreamRegistry:
+    """Routes each chain's requests to its fastest healthy upstream that keeps up with the head.
+
+    Upstreams are probed in the background with `eth_blockNumber` to track their latency
+    and head, only on chains with more than one upstream that got requests in the last
+    `idle_timeout` seconds. Requests fail over to the next upstream on errors and
+    timeouts.
+    """
+
+    def __init__(
+        self,
+        client: UpstreamClient,
+        endpoints: Dict[Chains, List[str]],
+        probe_interval: float = 10.0,
+        max_lag: float = 30.0,
+        head_listener: Optional[Callable[[Chains, int], None]] = None,
+        idle_timeout: float = 60.0,
+    ):
+        self.client = client
+        self.probe_interval = probe_interval
+        self.idle_timeout = idle_timeout
+        self.max_lag = max_lag
+        self.head_listener = head_listener
+        self.upstreams: Dict[Chains, List[Upstream]] = {
+            chain: [Upstream(url) for url in urls]
+            for chain, urls in endpoints.items()
+            if urls
+        }
+        self.demanded: Dict[Chains, float] = {}
+        self.task = None
+
+    @staticmethod
+    def parse_endpoints(
+        entries: List[str], path: Optional[str] = None
+    ) -> Dict[Chains, List[str]]:
+        """Reads upstream endpoints from `chain=url` entries and an optional JSON file.
+        Args:
+            entries (List[str]): Endpoints given as `chain=url`.
+            path (str): JSON file mapping chain ids to lists of urls.
+        Returns:
+            endpoints (Dict[Chains, List[str]]): Urls per chain.
+        """
+        endpoints = defaultdict(list)
+        if path:
+            with open(os.path.expanduser(path)) as f:
+                for chain_id, urls in json.load(f).items():
+                    endpoints[Chains(chain_id)].extend(urls)
+        for entry in entries:
+            chain_id, _, url = entry.partition("=")
+            if not url:
+                raise ValueError(f"Invalid upstream '{entry}', expected chain=url")
+            endpoints[Chains(chain_id)].append(url)
+        return dict(endpoints)
+
+    @property
+    def chains(self):
+        return self.upstreams.keys()
+
+    def ranked(self, chain: Chains, spread: int = 0) -> List[Upstream]:
+        """Returns the chain's upstreams, best candidates first.
+
+        Available upstreams within the allowed head lag come first, ordered by latency.
+        Lagging or backed-off upstreams are kept at the end as a last resort. A non-zero
+        `spread` rotates the healthy upstreams, so the parts of a split request are
+        served by all of them.
+        """
+        now = time.monotonic()
+        upstreams = self.upstreams[chain]
+        heads = [upstream.head for upstream in upstreams if upstream.head is not None]
+        best_head = max(heads) if heads else None
+        max_lag_blocks = max(2, self.max_lag / BLOCK_TIMES[chain])
+
+        def rank(upstream):
+            lagging = (
+                best_head is not None
+                and upstream.head is not None
+                and best_head - upstream.head > max_lag_blocks
+            )
+            latency = upstream.latency if upstream.latency is not None else 0
+            return (not upstream.available(now), lagging, latency)
+
+        ranked = sorted(upstreams, key=rank)
+        if spread:
+            healthy = sum(
+                1 for upstream in ranked if rank(upstream)[:2] == (False, False)
+            )
+            if healthy > 1:
+                shift = spread % healthy
+                ranked = ranked[shift:healthy] + ranked[:shift] + ranked[healthy:]
+        return ranked
+
+    async def post(
+        self, chain: Chains, payload: str, idempotent: bool = True, spread: int = 0
+    ) -> Tuple[int, str]:
+        """Sends the payload to the best upstream of the chain, failing over on errors.
+        Args:
+            chain (Chains): Chain the payload is for.
+            payload (str): JSON-RPC request body.
+            idempotent (bool): Whether the payload may be sent more than once.
+            spread (int): Index of the part of a split request, see `ranked`.
+        Returns:
+            status (int): HTTP status of the answering upstream.
+            body (str): Response body of the answering upstream.
+        """
+        upstreams = self.ranked(chain, spread)
+        for i, upstream in enumerate(upstreams):
+            last = i == len(upstreams) - 1
+            start = time.monotonic()
+            try:
+                # Failover replaces retries, except on the last upstream.
+                status, body = await self.client.post(
+                    upstream.url, payload, idempotent=idempotent and last
+                )
+            except aiohttp.ClientConnectorError:
+                # Nothing reached the upstream, any payload can go elsewhere.
+                upstream.record_failure()
+                if last:
+                    raise
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                upstream.record_failure()
+                if last or not idempotent:
+                    raise
+                continue
+            if status in RETRY_STATUSES and not last and idempotent:
+                upstream.record_failure()
+                continue
+            upstream.record_success(time.monotonic() - start)
+            return status, body
+
+    async def probe(self, chain: Chains, upstream: Upstream):
+        start = time.monotonic()
+        try:
+            status, body = await self.client.post(
+                upstream.url,
+                '{"jsonrpc":"2.0","id":1,"method":"eth_blockNumber","params":[]}',
+                idempotent=False,
+            )
+            if status != 200:
+                raise ValueError(f"status {status}")
+            head = int(json.loads(body)["result"], 16)
+        except Exception as e:
+            bt.logging.debug(f"Probe of {chain.value} upstream failed: {e}")
+            upstream.record_failure()
+            return
+        upstream.record_success(time.monotonic() - start)
+        upstream.head = head
+        if self.head_listener is not None:
+            self.head_listener(chain, head)
+
+    def start(self, chain: Chains):
+        # Must be called from the event loop serving requests, for each request.
+        self.demanded[chain] = time.monotonic()
+        if len(self.upstreams[chain]) > 1 and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.probe_loop())
+
+    def probed(self) -> List[Chains]:
+        # A single upstream leaves nothing to choose between, real requests keep
+        # its latency and health up to date.
+        now = time.monotonic()
+        return [
+            chain
+            for chain, since in self.demanded.items()
+            if now - since < self.idle_timeout and len(self.upstreams[chain]) > 1
+        ]
+
+    async def probe_loop(self):
+        # Stops once no chain needs probing, the next request restarts it.
+        while True:
+            chains = self.probed()
+            if not chains:
+                return
+            await asyncio.gather(
+                *(
+                    self.probe(chain, upstream)
+                    for chain in chains
+                    for upstream in self.upstreams[chain]
+                )
+            )
+            await asyncio.sleep(self.probe_interval)
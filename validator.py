@@ -1,17 +1,71 @@
 import asyncio
 import os
+import random
 import json
 import websockets
 import argparse
 import traceback
 import bittensor as bt
-import bittensor.utils as btu
-from substrateinterface import SubstrateInterface
-from protocol import BlockchainRequest
-from utils.uids import get_random_uids
-from collections import defaultdict
+from protocol import BlockchainRequest, Chains, FINALITY_DEPTHS
+from utils.uids import MinerSelector
+from utils.latency import LatencyWindow
+from utils.block_tracker import BlockTracker
+from utils.scoreboard import Scoreboard, chain_index
+from utils.batcher import RequestBatcher
+from utils.jsonrpc import parse_call
+from utils.consensus import (
+    head_of,
+    is_volatile,
+    lookup_ids,
+    response_digest,
+    vote,
+)
+from utils.encoding import ENCODINGS, decode
+from utils.recorder import TrafficRecorder
+from utils.metrics import REGISTRY, start_http_server
 import time
 
+RECV_SECONDS = REGISTRY.histogram(
+    "validator_recv_seconds", "Time waiting for the next entrypoint message."
+)
+SELECT_SECONDS = REGISTRY.histogram(
+    "validator_select_seconds", "Time spent picking the miners to query."
+)
+MINER_SECONDS = REGISTRY.histogram(
+    "validator_miner_seconds",
+    "Round-trip time of a miner query.",
+    labels=("outcome",),
+)
+SEND_SECONDS = REGISTRY.histogram(
+    "validator_send_seconds", "Time spent sending a reply to the entrypoint."
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "validator_request_seconds", "Time from receiving a request to its reply."
+)
+SET_WEIGHTS_SECONDS = REGISTRY.histogram(
+    "validator_set_weights_seconds", "Time spent setting weights on chain."
+)
+REQUESTS = REGISTRY.counter(
+    "validator_requests", "Requests answered.", labels=("outcome",)
+)
+IN_FLIGHT = REGISTRY.gauge("validator_in_flight", "Requests being served.")
+
+
+def digest_response(response, lookups, final_block):
+    """Decodes a miner response and hashes its outcome, see `response_digest`.
+    Args:
+        response (BlockchainRequest): Miner response with a body.
+        lookups (Set[str]): Ids of the lookup calls of the request.
+        final_block (int): Highest finalized block of the chain, None if unknown.
+    Returns:
+        digest (bytes): 16 byte digest, None if the body is not JSON.
+        settled (bool): False if a lookup answer is not in a final block yet.
+    Raises:
+        ValueError: If the body cannot be decoded.
+    """
+    body = decode(response.response, response.response_encoding)
+    return response_digest(body, lookups, final_block)
+
 
 class Validator:
     def __init__(self):
@@ -23,14 +77,46 @@ class Validator:
         self.scores = [1.0] * len(self.metagraph.S)
         self.last_update = 0
         self.current_block = 0
-        self.tempo = self.node_query("SubtensorModule", "Tempo", [self.config.netuid])
-        self.moving_avg_scores = [1.0] * len(self.metagraph.S)
+        self.setup_block_tracker()
+        self.tempo = self.block_tracker.tempo
         self.alpha = 0.1
-        self.node = SubstrateInterface(url=self.config.subtensor.chain_endpoint)
-        self.miner_responses = defaultdict(
-            lambda: {"last_request_time": 0, "total_requests": 0, "total_responses": 0}
+        self.scoreboard = Scoreboard(0, alpha=self.alpha)
+        self.scoreboard.sync(self.metagraph.hotkeys)
+        self.state_path = os.path.join(self.config.full_path, "state.npy")
+        self.load_state()
+        self.scored_block = self.current_block
+        # Maximum number of miners to query for each request
+        self.query_miners_count = self.config.query_miners_count
+        self.miner_latency = LatencyWindow()
+        self.request_latency = LatencyWindow()
+        self.served_requests = 0
+        self.background_tasks = set()
+        self.jobs = {}
+        # The subtensor's websocket is not thread-safe, jobs take turns using it.
+        self.subtensor_lock = asyncio.Lock()
+        # Highest block known to be final on each chain, learned from miners.
+        self.final_blocks = {}
+        self.selector = MinerSelector(
+            self.scoreboard,
+            explore=self.config.explore_share,
+            recheck=self.config.unsupported_recheck,
         )
-        self.query_miners_count = 10  # Number of miners to query for each request
+        self.selector.rebuild(self.metagraph, 100, exclude=[self.my_uid])
+        self.recorder = None
+        if self.config.record_dir:
+            self.recorder = TrafficRecorder(
+                self.config.record_dir,
+                sample_rate=self.config.record_sample_rate,
+                max_bytes=self.config.record_max_mb * 1024 * 1024,
+                max_files=self.config.record_max_files,
+            )
+        self.batcher = None
+        if self.config.batch_window > 0:
+            self.batcher = RequestBatcher(
+                self.forward_batch,
+                window=self.config.batch_window,
+                max_size=self.config.batch_max_size,
+            )
 
     def get_config(self):
         # Set up the configuration parser.
@@ -45,6 +131,157 @@ class Validator:
         parser.add_argument(
             "--netuid", type=int, default=1, help="The chain subnet uid."
         )
+        parser.add_argument(
+            "--entrypoint",
+            type=str,
+            default="wss://app.tenfura.thoma.tech/v1/ws",
+            help="Websocket url of the entrypoint server.",
+        )
+        parser.add_argument(
+            "--max_in_flight",
+            type=int,
+            default=256,
+            help="Maximum number of entrypoint requests served concurrently.",
+        )
+        parser.add_argument(
+            "--query_miners_count",
+            type=int,
+            default=10,
+            help="Maximum number of miners queried for each request.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=12,
+            help="Seconds to wait for a miner response.",
+        )
+        parser.add_argument(
+            "--hedge_initial_miners",
+            type=int,
+            default=2,
+            help="Number of best ranked miners queried first for each request.",
+        )
+        parser.add_argument(
+            "--hedge_percentile",
+            type=float,
+            default=90,
+            help="Miner latency percentile to wait for before querying another miner.",
+        )
+        parser.add_argument(
+            "--hedge_min_delay",
+            type=float,
+            default=0.05,
+            help="Lower bound in seconds for the hedge delay.",
+        )
+        parser.add_argument(
+            "--hedge_max_delay",
+            type=float,
+            default=2.0,
+            help="Upper bound in seconds for the hedge delay, also used until latencies are known.",
+        )
+        parser.add_argument(
+            "--explore_share",
+            type=float,
+            default=0.1,
+            help="Share of miner picks drawn uniformly so new miners still get probed.",
+        )
+        parser.add_argument(
+            "--unsupported_recheck",
+            type=float,
+            default=600,
+            help="Seconds before a miner that reported a chain as unsupported is probed on it again.",
+        )
+        parser.add_argument(
+            "--block_poll_interval",
+            type=float,
+            default=12,
+            help="Seconds between background reads of the chain state.",
+        )
+        parser.add_argument(
+            "--batch_window",
+            type=float,
+            default=0,
+            help="Seconds to collect same-chain requests into one batched synapse, 0 disables batching.",
+        )
+        parser.add_argument(
+            "--batch_max_size",
+            type=int,
+            default=20,
+            help="Maximum number of requests in one batched synapse.",
+        )
+        parser.add_argument(
+            "--verify_quorum",
+            type=int,
+            default=2,
+            help="Minimum number of matching responses for a consensus.",
+        )
+        parser.add_argument(
+            "--verify_sample_rate",
+            type=float,
+            default=0.1,
+            help="Share of requests also sent to enough extra miners in the background to verify responses.",
+        )
+        parser.add_argument(
+            "--snapshot_interval",
+            type=float,
+            default=300,
+            help="Seconds between snapshots of the miner statistics.",
+        )
+        parser.add_argument(
+            "--set_weights_retries",
+            type=int,
+            default=3,
+            help="Retries of a failed weight submission.",
+        )
+        parser.add_argument(
+            "--set_weights_retry_delay",
+            type=float,
+            default=12,
+            help="Seconds before retrying a failed weight submission, doubled on each retry.",
+        )
+        parser.add_argument(
+            "--metagraph_sync_interval",
+            type=float,
+            default=600,
+            help="Seconds between background metagraph syncs, on top of the sync after setting weights.",
+        )
+        parser.add_argument(
+            "--accept_encodings",
+            type=str,
+            nargs="*",
+            default=list(ENCODINGS),
+            help="Response encodings advertised to miners for large responses, none disables compression.",
+        )
+        parser.add_argument(
+            "--record_dir",
+            type=str,
+            default=None,
+            help="Directory to record served entrypoint requests to, for replay with benchmarks/replay.py.",
+        )
+        parser.add_argument(
+            "--record_sample_rate",
+            type=float,
+            default=1.0,
+            help="Share of requests recorded.",
+        )
+        parser.add_argument(
+            "--record_max_mb",
+            type=int,
+            default=100,
+            help="Uncompressed size after which the recording rotates to a new file.",
+        )
+        parser.add_argument(
+            "--record_max_files",
+            type=int,
+            default=10,
+            help="Number of recording files kept.",
+        )
+        parser.add_argument(
+            "--metrics_port",
+            type=int,
+            default=0,
+            help="Port serving Prometheus metrics on /metrics, 0 disables the endpoint.",
+        )
         # Adds subtensor specific arguments.
         bt.subtensor.add_args(parser)
         # Adds logging specific arguments.
@@ -112,127 +349,500 @@ class Validator:
         self.scores = [1.0] * len(self.metagraph.S)
         bt.logging.info(f"Weights: {self.scores}")
 
-    def node_query(self, module, method, params):
+    def setup_block_tracker(self):
+        # Chain state is refreshed in the background and read from memory.
+        self.block_tracker = BlockTracker(
+            self.config.subtensor.chain_endpoint,
+            self.config.netuid,
+            interval=self.config.block_poll_interval,
+        )
+        self.block_tracker.refresh()
+
+    def load_state(self):
+        # Warm restart from the last snapshot, uids are matched by hotkey.
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            restored = self.scoreboard.load(self.state_path)
+            bt.logging.info(f"Restored statistics of {restored} miners from snapshot.")
+        except Exception as e:
+            bt.logging.warning(f"Failed to load snapshot {self.state_path}: {e}")
+
+    def save_state(self):
+        Scoreboard.write(self.state_path, self.scoreboard.snapshot())
+
+    async def save_state_loop(self):
+        while True:
+            await asyncio.sleep(self.config.snapshot_interval)
+            try:
+                # Copy on the event loop for a consistent view, write from a thread.
+                state = self.scoreboard.snapshot()
+                await asyncio.to_thread(Scoreboard.write, self.state_path, state)
+            except Exception as e:
+                bt.logging.warning(f"Failed to save snapshot: {e}")
+
+    def parse_request(self, message):
+        # Split the entrypoint message into its envelope id and the synapse.
+        data = json.loads(message)
+        envelope_id = data.pop("id", None)
+        return envelope_id, BlockchainRequest(**data)
+
+    def build_reply(
+        self, envelope_id, synapse, response=None, error=None, encoding=None
+    ):
+        # Requests carrying an envelope id get a correlated envelope back.
+        if envelope_id is not None:
+            if error is not None:
+                return json.dumps({"id": envelope_id, "error": error})
+            if encoding is not None:
+                return json.dumps(
+                    {"id": envelope_id, "response": response, "encoding": encoding}
+                )
+            return json.dumps({"id": envelope_id, "response": response})
+        if error is None:
+            return response
+        # Legacy errors echo the JSON-RPC id so they can still be correlated.
+        reply = {"error": error}
+        try:
+            payload = json.loads(synapse.payload)
+            if isinstance(payload, dict) and "id" in payload:
+                reply["id"] = payload["id"]
+        except (TypeError, ValueError):
+            pass
+        return json.dumps(reply)
+
+    def is_valid_response(self, response):
+        return (
+            response is not None
+            and response.response is not None
+            and not response.error
+            and (
+                response.response_encoding is None
+                or response.response_encoding in self.config.accept_encodings
+            )
+        )
+
+    def hedge_delay(self):
+        # Wait for a typical miner before asking another one.
+        delay = self.miner_latency.percentile(
+            self.config.hedge_percentile, default=self.config.hedge_max_delay
+        )
+        return min(
+            max(delay, self.config.hedge_min_delay), self.config.hedge_max_delay
+        )
+
+    async def call_miner(self, uid, synapse):
+        start = time.time()
+        try:
+            response = await self.dendrite.call(
+                target_axon=self.metagraph.axons[uid],
+                synapse=synapse.model_copy(),
+                timeout=self.config.timeout,
+                deserialize=True,
+            )
+        except Exception as e:
+            bt.logging.debug(f"Failed to query miner {uid}: {e}")
+            response = None
+        latency = time.time() - start
+        if self.is_valid_response(response):
+            outcome = "success"
+        elif response is not None and response.error:
+            outcome = "error"
+        else:
+            outcome = "failure"
+        MINER_SECONDS.labels(outcome).observe(latency)
+        return uid, response, latency
+
+    def run_in_background(self, coro):
+        # Keep a reference so background tasks are not garbage collected.
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def schedule(self, name, job):
+        # Maintenance jobs run off the request path, one of each kind at a time.
+        task = self.jobs.get(name)
+        if task is None or task.done():
+            self.jobs[name] = self.run_in_background(job())
+
+    async def query_miners(self, synapse):
+        """Query miners with hedging and return as soon as one answers.
+
+        The best ranked miners are queried first, and another miner is added whenever
+        no valid response arrives within the hedge delay or a miner fails. Returns the
+        response to forward, the outcomes collected so far and the still pending calls.
+        """
+        # Miners come out in draw order, so the most likely fast ones are queried first.
+        with SELECT_SECONDS.time():
+            miner_uids = self.selector.sample(
+                self.query_miners_count, chain=chain_index(synapse.chain_id)
+            )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config.timeout
+        pending = set()
+        outcomes = []
+        launched = 0
+        winner = None
+
+        def launch(count):
+            nonlocal launched
+            if count <= 0:
+                return
+            for uid in miner_uids[launched : launched + count]:
+                pending.add(asyncio.create_task(self.call_miner(uid, synapse)))
+            launched = min(launched + count, len(miner_uids))
+
+        launch(self.config.hedge_initial_miners)
+        while pending and winner is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            wait = remaining
+            if launched < len(miner_uids):
+                wait = min(self.hedge_delay(), remaining)
+            done, pending = await asyncio.wait(
+                pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                outcome = task.result()
+                outcomes.append(outcome)
+                if winner is None and self.is_valid_response(outcome[1]):
+                    winner = outcome[1]
+            if winner is None:
+                # Hedge: nobody answered in time or the answers were unusable.
+                launch(1)
+
+        if winner is None:
+            # Forward the first miner error if nobody succeeded.
+            winner = next(
+                (
+                    response
+                    for _, response, _ in outcomes
+                    if response is not None and response.error
+                ),
+                None,
+            )
+        if random.random() < self.config.verify_sample_rate:
+            # Audit a sample of requests with enough miners to reach a quorum.
+            launch(self.config.verify_quorum + 1 - launched)
+        return winner, outcomes, pending
+
+    async def score_miners(self, synapse, outcomes, pending):
+        # Stragglers keep running in the background, only to feed scoring.
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            outcomes = outcomes + [task.result() for task in done]
+        chain = chain_index(synapse.chain_id)
+        self.update_scores(outcomes, chain)
+        await self.verify_responses(synapse, outcomes, chain)
+        self.maybe_set_weights()
+
+    async def verify_responses(self, synapse, outcomes, chain=None):
+        # Compare hashed outcomes of the miners queried for the same request.
+        if '"eth_blockNumber"' in synapse.payload:
+            self.observe_head(synapse, outcomes)
+        final_block = self.final_blocks.get(synapse.chain_id)
+        if is_volatile(synapse.payload, final_block):
+            return
+        answered = []
+        for uid, response, _ in outcomes:
+            if response is None:
+                continue
+            if response.error:
+                self.scoreboard.record_error(uid, chain)
+            elif response.response is not None:
+                answered.append((uid, response))
+        if len(answered) < self.config.verify_quorum:
+            # No vote is possible, skip decoding and hashing the bodies.
+            return
+        lookups = lookup_ids(synapse.payload)
+        digests = {}
+        for uid, response in answered:
+            try:
+                # Parsing and hashing large bodies would stall every in-flight reply.
+                if len(response.response) >= 256 * 1024:
+                    digest, final = await asyncio.to_thread(
+                        digest_response, response, lookups, final_block
+                    )
+                else:
+                    digest, final = digest_response(response, lookups, final_block)
+            except ValueError:
+                self.scoreboard.record_error(uid, chain)
+                continue
+            if not final:
+                # A miner a block behind answers null to a lookup another one found.
+                return
+            if digest is not None:
+                digests[uid] = digest
+        consensus = vote(list(digests.values()), quorum=self.config.verify_quorum)
+        if consensus is None:
+            return
+        for uid, digest in digests.items():
+            self.scoreboard.record_verification(uid, digest == consensus)
+            self.selector.update(uid, chain)
+
+    def observe_head(self, synapse, outcomes):
+        # Calls at numbered blocks are only voted on once those blocks are final.
+        call = parse_call(synapse.payload)
+        if call is None or call["method"] != "eth_blockNumber":
+            return
+        try:
+            depth = FINALITY_DEPTHS[Chains(synapse.chain_id)]
+        except ValueError:
+            return
+        heads = []
+        for _, response, _ in outcomes:
+            if response is None or response.error or response.response is None:
+                continue
+            try:
+                body = decode(response.response, response.response_encoding)
+            except ValueError:
+                continue
+            head = head_of(body)
+            if head is not None:
+                heads.append(head)
+        if len(heads) < self.config.verify_quorum:
+            return
+        # The lower median ignores a minority of miners answering a far off head.
+        final = sorted(heads)[(len(heads) - 1) // 2] - depth
+        if final > self.final_blocks.get(synapse.chain_id, -1):
+            self.final_blocks[synapse.chain_id] = final
+
+    def update_scores(self, outcomes, chain=None):
+        # Only the queried miners are touched, scores advance once per block.
+        current_time = time.time()
+        for uid, response, latency in outcomes:
+            success = self.is_valid_response(response)
+            if success:
+                self.miner_latency.add(latency)
+            self.scoreboard.record(uid, success, latency, current_time, chain)
+            if (
+                chain is not None
+                and response is not None
+                and response.error
+                and response.error.startswith("Unsupported chain")
+            ):
+                self.scoreboard.record_unsupported(uid, chain, current_time)
+            self.selector.update(uid, chain)
+
+    def record_request_latency(self, latency):
+        self.request_latency.add(latency)
+        self.served_requests += 1
+        if self.served_requests % 100 == 0:
+            bt.logging.info(
+                f"Served {self.served_requests} requests | "
+                f"reply p50: {self.request_latency.percentile(50):.3f}s "
+                f"p99: {self.request_latency.percentile(99):.3f}s | "
+                f"miner p50: {self.miner_latency.percentile(50, default=0):.3f}s "
+                f"p99: {self.miner_latency.percentile(99, default=0):.3f}s | "
+                f"hedge delay: {self.hedge_delay():.3f}s"
+            )
+
+    def maybe_set_weights(self):
+        self.current_block = self.block_tracker.current_block
+        self.tempo = self.block_tracker.tempo
+        if self.current_block != self.scored_block:
+            self.scored_block = self.current_block
+            self.scoreboard.step()
+            scores = self.scoreboard.moving_avg_scores
+            bt.logging.info(
+                f"Block {self.current_block} | Moving Average Scores: "
+                f"mean {scores.mean():.3f} min {scores.min():.3f} max {scores.max():.3f}"
+            )
+            bt.logging.debug(f"Moving Average Scores: {scores.tolist()}")
+        last_update = self.block_tracker.blocks_since_update(self.my_uid)
+        if last_update is not None:
+            self.last_update = last_update
+        else:
+            self.last_update = self.tempo + 2
+
+        # set weights once every tempo + 1
+        if self.last_update > self.tempo + 1:
+            self.schedule("set_weights", self.set_weights)
+
+    async def set_weights(self):
+        # Snapshot on the event loop, scores keep moving while the extrinsic is pending.
+        metagraph = self.metagraph
+        weights = self.scoreboard.weights()[: metagraph.n.item()]
+        uids = metagraph.uids
+        bt.logging.info(f"Setting weights: {weights}")
+        delay = self.config.set_weights_retry_delay
+        for attempt in range(1 + self.config.set_weights_retries):
+            try:
+                # Update the incentive mechanism on the Bittensor blockchain.
+                async with self.subtensor_lock:
+                    with SET_WEIGHTS_SECONDS.time():
+                        result = await asyncio.to_thread(
+                            self.subtensor.set_weights,
+                            netuid=self.config.netuid,
+                            wallet=self.wallet,
+                            uids=uids,
+                            weights=weights,
+                            wait_for_inclusion=True,
+                        )
+                success, message = (
+                    result if isinstance(result, tuple) else (bool(result), "")
+                )
+            except Exception as e:
+                success, message = False, str(e)
+            if success:
+                break
+            bt.logging.warning(
+                f"Failed to set weights (attempt {attempt + 1}): {message}"
+            )
+            # Also holds back the next submission after the last attempt.
+            await asyncio.sleep(delay)
+            delay *= 2
+        else:
+            bt.logging.error("Giving up setting weights until the next check.")
+            return
+        self.block_tracker.mark_updated(self.my_uid)
+        self.schedule("sync_metagraph", self.sync_metagraph)
+
+    async def sync_metagraph(self):
+        # Build the new metagraph in a worker thread and swap it in one step, so
+        # requests never see a half-synced metagraph or stale derived indexes.
         try:
-            result = self.node.query(module, method, params).value
+            async with self.subtensor_lock:
+                metagraph = await asyncio.to_thread(
+                    self.subtensor.metagraph, self.config.netuid
+                )
+        except Exception as e:
+            bt.logging.warning(f"Failed to sync metagraph: {e}")
+            return
+        if self.wallet.hotkey.ss58_address not in metagraph.hotkeys:
+            bt.logging.error("Validator hotkey is no longer registered.")
+            return
+        self.metagraph = metagraph
+        self.my_uid = metagraph.hotkeys.index(self.wallet.hotkey.ss58_address)
+        self.scoreboard.sync(metagraph.hotkeys)
+        self.selector.rebuild(metagraph, 100, exclude=[self.my_uid])
+
+    async def sync_metagraph_loop(self):
+        while True:
+            await asyncio.sleep(self.config.metagraph_sync_interval)
+            self.schedule("sync_metagraph", self.sync_metagraph)
 
-        except Exception:
-            # reinitilize node
-            self.node = SubstrateInterface(url=self.config.subtensor.chain_endpoint)
-            result = self.node.query(module, method, params).value
+    async def forward(self, synapse, passthrough=()):
+        """Queries miners for the synapse and returns what to reply.
+        Args:
+            synapse (BlockchainRequest): Request to forward.
+            passthrough (Iterable[str]): Encodings the requester decodes itself, a
+                response in one of them is forwarded without decoding it.
+        Returns:
+            response (str): Response body, None on failure.
+            error (str): Error message if no miner answered.
+            encoding (str): Encoding of the response, None if it is decoded.
+        """
+        synapse.accept_encoding = self.config.accept_encodings
+        response, outcomes, pending = await self.query_miners(synapse)
+        # Scoring happens off the reply path.
+        self.run_in_background(self.score_miners(synapse, outcomes, pending))
+        if response is None:
+            return None, "Internal error", None
+        if response.error:
+            return None, response.error, None
+        encoding = response.response_encoding
+        if encoding is None or encoding in passthrough:
+            return response.response, None, encoding
+        # Only the winning response is decoded, large bodies off the event loop.
+        if len(response.response) >= 1024 * 1024:
+            body = await asyncio.to_thread(decode, response.response, encoding)
+        else:
+            body = decode(response.response, encoding)
+        return body, None, None
 
-        return result
+    async def forward_batch(self, chain_id, payload):
+        synapse = BlockchainRequest(chain_id=chain_id, payload=payload)
+        response, error, _ = await self.forward(synapse)
+        return response, error
+
+    async def handle_request(self, websocket, message):
+        start = time.time()
+        envelope_id = None
+        synapse = None
+        IN_FLIGHT.inc()
+        try:
+            envelope_id, synapse = self.parse_request(message)
+            # Enveloped replies can carry a response the entrypoint decodes itself.
+            passthrough = synapse.accept_encoding if envelope_id is not None else []
+            encoding = None
+            call = parse_call(synapse.payload) if self.batcher is not None else None
+            if call is not None and "id" in call:
+                response, error = await self.batcher.submit(synapse.chain_id, call)
+            else:
+                response, error, encoding = await self.forward(synapse, passthrough)
+
+            reply = self.build_reply(
+                envelope_id, synapse, response=response, error=error, encoding=encoding
+            )
+            with SEND_SECONDS.time():
+                await websocket.send(reply)
+            latency = time.time() - start
+            REQUEST_SECONDS.observe(latency)
+            REQUESTS.labels("success" if error is None else "error").inc()
+            self.record_request_latency(latency)
+            if self.recorder is not None:
+                self.recorder.record(
+                    start, synapse.chain_id, synapse.payload, latency, error
+                )
+
+        except websockets.exceptions.ConnectionClosed:
+            # The connection loop in run handles reconnection.
+            pass
+        except Exception as e:
+            bt.logging.error(f"Failed to handle request: {e}")
+            traceback.print_exc()
+            REQUESTS.labels("internal_error").inc()
+            try:
+                await websocket.send(
+                    self.build_reply(envelope_id, synapse, error="Internal error")
+                )
+            except websockets.exceptions.ConnectionClosed:
+                pass
+        finally:
+            IN_FLIGHT.dec()
 
     async def run(self):
         # The Main Validation Loop.
         bt.logging.info("Starting validator loop.")
 
-        uri = f"wss://app.tenfura.thoma.tech/v1/ws"
+        uri = self.config.entrypoint
+        # Bound the number of requests being served concurrently.
+        in_flight = asyncio.Semaphore(self.config.max_in_flight)
+        self.block_tracker.start()
+        self.run_in_background(self.save_state_loop())
+        self.run_in_background(self.sync_metagraph_loop())
+        start_http_server(self.config.metrics_port)
+        if self.recorder is not None:
+            self.recorder.start()
         while True:
+            tasks = set()
             try:
                 async with websockets.connect(uri) as websocket:
                     bt.logging.info("Connected to entrypoint server")
                     while True:
+                        await in_flight.acquire()
                         try:
-                            request = await websocket.recv()
-                            synapse = BlockchainRequest(**json.loads(request))
-
-                            # Process the request (similar to the previous handle_request function)
-                            miner_uids = get_random_uids(
-                                self.metagraph,
-                                self.query_miners_count,
-                                100,
-                                exclude=[self.my_uid],
-                            )
-                            axons = [self.metagraph.axons[uid] for uid in miner_uids]
-                            responses = self.dendrite.query(
-                                axons=axons,
-                                synapse=synapse,
-                                deserialize=True,
-                                timeout=12,
-                            )
-                            # Update miner responses and scores
-                            current_time = time.time()
-                            for idx, uid in enumerate(miner_uids):
-                                self.miner_responses[uid][
-                                    "last_request_time"
-                                ] = current_time
-                                self.miner_responses[uid]["total_requests"] += 1
-                                response = responses[idx]
-                                if response is not None:
-                                    self.miner_responses[uid]["total_responses"] += 1
-
-                            if responses and any(r is not None for r in responses):
-                                valid_response = next(
-                                    r for r in responses if r is not None
-                                )
-                                if valid_response.error:
-                                    await websocket.send(
-                                        json.dumps({"error": valid_response.error})
-                                    )
-                                else:
-                                    await websocket.send(valid_response.response)
-                            else:
-                                await websocket.send(
-                                    json.dumps({"error": "Internal error"})
-                                )
-
-                            # Update scores based on miner responses
-                            for uid in range(len(self.metagraph.S)):
-                                miner_data = self.miner_responses[uid]
-                                if miner_data["total_requests"] > 0:
-                                    current_score = (
-                                        miner_data["total_responses"]
-                                        / miner_data["total_requests"]
-                                    )
-                                else:
-                                    current_score = 1
-                                self.moving_avg_scores[uid] = (
-                                    1 - self.alpha
-                                ) * self.moving_avg_scores[
-                                    uid
-                                ] + self.alpha * current_score
-
-                            bt.logging.info(
-                                f"Moving Average Scores: {self.moving_avg_scores}"
-                            )
-
-                            self.current_block = self.node_query("System", "Number", [])
-                            last_updates = self.node_query(
-                                "SubtensorModule",
-                                "LastUpdate",
-                                [self.config.netuid],
-                            )
-                            if self.my_uid in last_updates:
-                                self.last_update = (
-                                    self.current_block - last_updates[self.my_uid]
-                                )
-                            else:
-                                self.last_update = self.tempo + 2
-
-                            # set weights once every tempo + 1
-                            if self.last_update > self.tempo + 1:
-                                total = sum(self.moving_avg_scores)
-                                weights = [
-                                    score / total for score in self.moving_avg_scores
-                                ]
-                                bt.logging.info(f"Setting weights: {weights}")
-                                # Update the incentive mechanism on the Bittensor blockchain.
-                                result = self.subtensor.set_weights(
-                                    netuid=self.config.netuid,
-                                    wallet=self.wallet,
-                                    uids=self.metagraph.uids,
-                                    weights=weights,
-                                    wait_for_inclusion=True,
-                                )
-                                self.metagraph.sync()
-
+                            with RECV_SECONDS.time():
+                                request = await websocket.recv()
                         except websockets.exceptions.ConnectionClosed:
+                            in_flight.release()
                             bt.logging.warning(
                                 "Connection to entrypoint server closed. Attempting to reconnect..."
                             )
                             break  # Break the inner loop to attempt reconnection
 
+                        # Each request is served by its own task, replies go out as they finish.
+                        task = asyncio.create_task(
+                            self.handle_request(websocket, request)
+                        )
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                        task.add_done_callback(lambda _: in_flight.release())
+
             except (OSError, websockets.exceptions.WebSocketException) as e:
                 bt.logging.error(f"Failed to connect to entrypoint server: {e}")
                 bt.logging.info("Waiting before attempting to reconnect...")
@@ -248,12 +858,22 @@ class Validator:
                 bt.logging.success("Keyboard interrupt detected. Exiting validator.")
                 return
 
+            finally:
+                # Replies can no longer be delivered once the connection is gone.
+                for task in tasks:
+                    task.cancel()
+
             # No need for the sleep here, as it's handled by the connection attempt
 
 
 async def main():
     validator = Validator()
-    await validator.run()
+    try:
+        await validator.run()
+    finally:
+        validator.save_state()
+        if validator.recorder is not None:
+            validator.recorder.close()
 
 
 if __name__ == "__main__":